@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Certificate Generator Benchmark
+Times each stage of certificate generation on synthetic rosters and writes the
+results as JSON, so runs on different commits can be compared.
+
+Stages:
+    parse     reading the roster (CertificateGenerator._read_participants)
+    fill      fill_template for every row
+    combined  writing the combined .tex (generate_certificates_from_csv)
+    compile   the compile/move/cleanup loop (generate_individual_certificates_from_csv),
+              on at most --compile-rows rows
+
+By default the compile stage uses a stub xelatex that writes a blank PDF, so the
+benchmark runs on machines without TeX; pass --xelatex to time a real engine.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+from generate_certificates import CertificateGenerator
+
+DEFAULT_SIZES = [10, 1000, 100000, 1000000]
+
+# Name parts mixing ASCII, accented Latin, and non-Latin scripts
+LASTNAMES = ["Lincoln", "Müller", "Kovács", "Ødegård", "O'Brien", "Łukasiewicz", "Nguyễn", "Иванов",
+             "Παπαδόπουλος", "山田", "Dvořák", "García Márquez", "Smith-Jones", "Ng"]
+FIRSTNAMES = ["Abraham", "Jürgen", "Gyula", "Åse", "Siobhán", "Zoë", "Thị Minh", "Пётр", "Νίκος",
+              "太郎", "Antonín", "José", "Mary Ann", "Li"]
+
+STUB_XELATEX = r'''#!/usr/bin/env python3
+# Stub xelatex for benchmarks: writes a PDF with one blank page per certificate
+import os
+import sys
+
+args = sys.argv[1:]
+if "--version" in args:
+    print("stub xelatex")
+    sys.exit(0)
+source = [arg for arg in args if not arg.startswith("-") and not arg.startswith("&")][-1]
+job = os.path.splitext(os.path.basename(source))[0]
+for arg in args:
+    if arg.startswith("-jobname="):
+        job = arg.split("=", 1)[1]
+with open(job + ".log", "w") as f:
+    f.write("This is stub xelatex\n")
+if "-ini" in args:
+    open(job + ".fmt", "w").close()
+    sys.exit(0)
+with open(source, encoding="utf-8") as f:
+    body = f.read().split("\\begin{document}", 1)[-1]
+pages = max(1, body.count("\\clearpage") + body.count("\\newpage"))
+objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+           "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join("%d 0 R" % (3 + i) for i in range(pages)), pages)]
+objects += ["<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"] * pages
+pdf = b"%PDF-1.4\n"
+offsets = []
+for number, obj in enumerate(objects, 1):
+    offsets.append(len(pdf))
+    pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj.encode())
+xref = len(pdf)
+pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+with open(job + ".pdf", "wb") as f:
+    f.write(pdf)
+with open(job + ".aux", "w") as f:
+    f.write("")
+'''
+
+
+def write_synthetic_roster(path: str, rows: int, seed: int = 0):
+    """Write a CSV roster with Unicode names and some blank or invalid completion dates."""
+    import csv
+    rng = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Lastname", "Name", "completion_date"])
+        for i in range(rows):
+            roll = rng.random()
+            if roll < 0.05:
+                completion_date = ""
+            elif roll < 0.08:
+                completion_date = rng.choice(["2025-13-01", "17.07.2025", "n/a", "2025-02-30"])
+            else:
+                completion_date = (start + datetime.timedelta(days=rng.randrange(2000))).isoformat()
+            # The row number keeps names (and therefore output file names) unique
+            writer.writerow([rng.choice(LASTNAMES), f"{rng.choice(FIRSTNAMES)} {i}", completion_date])
+
+
+def write_stub_xelatex(directory: str) -> str:
+    path = os.path.join(directory, "xelatex")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(STUB_XELATEX.replace("#!/usr/bin/env python3", f"#!{sys.executable}", 1))
+    os.chmod(path, 0o755)
+    return path
+
+
+def timed(stage: str, rows: int, results: list, size: int, func):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    results.append({
+        "size": size,
+        "stage": stage,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+    })
+    print(f"  {stage:<9} {rows:>9} rows  {seconds:10.3f} s")
+
+
+def benchmark_size(generator: CertificateGenerator, size: int, work_dir: str, compile_rows: int,
+                   workers: int, results: list):
+    print(f"Roster with {size} rows:")
+    roster = os.path.join(work_dir, f"roster_{size}.csv")
+    write_synthetic_roster(roster, size)
+
+    def parse():
+        for _ in generator._read_participants(roster):
+            pass
+
+    def fill():
+        fields = {
+            "SUBTITLE": "",
+            "WORKSHOP": "Benchmark Workshop",
+            "DATE_RANGE": "2025-01-01 to 2025-02-01",
+            "TUTORS": "Dr. Bench Mark",
+            "DURATION": "26 h",
+            "CONTENTS": generator._contents_items(["Item 1", "Item 2", "Item 3"]),
+            "SIGNATORY1": "Dr. Bench Mark",
+            "SIGNATORY2": "Prof. Dr. Chair",
+        }
+        for name, completion_date in generator._read_participants(roster):
+            fields["NAME"] = name
+            fields["DATE"] = completion_date
+            generator.fill_template(fields)
+
+    def combined():
+        generator.generate_certificates_from_csv(roster, output_file=os.path.join(work_dir, f"combined_{size}.tex"))
+
+    timed("parse", size, results, size, parse)
+    timed("fill", size, results, size, fill)
+    timed("combined", size, results, size, combined)
+
+    if compile_rows:
+        rows = min(size, compile_rows)
+        compile_roster = os.path.join(work_dir, f"compile_{size}.csv")
+        with open(roster, encoding='utf-8') as source, open(compile_roster, 'w', encoding='utf-8') as target:
+            for _ in range(rows + 1):
+                target.write(source.readline())
+        build_dir = os.path.join(work_dir, f"build_{size}")
+
+        def compile_loop():
+            # The loop prints one line per certificate; keep the benchmark output readable
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                generator.generate_individual_certificates_from_csv(
+                    compile_roster,
+                    output_dir=os.path.join(build_dir, "pdfs"),
+                    tex_dir=os.path.join(build_dir, "tex"),
+                    workers=workers,
+                )
+
+        timed("compile", rows, results, size, compile_loop)
+
+
+def git_commit() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def compare(results: list, baseline_file: str):
+    """Print the time ratio of every stage against a previous results file (>1 means slower)."""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    before = {(entry["size"], entry["stage"]): entry for entry in baseline["results"]}
+    print(f"\nCompared with {baseline_file} (commit {baseline.get('commit')}):")
+    for entry in results:
+        previous = before.get((entry["size"], entry["stage"]))
+        if previous is None or previous["rows"] != entry["rows"] or not previous["seconds"]:
+            continue
+        ratio = entry["seconds"] / previous["seconds"]
+        print(f"  {entry['stage']:<9} {entry['size']:>9} rows  {ratio:6.2f}x")
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark certificate generation stages")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated roster sizes")
+    parser.add_argument("--compile-rows", type=int, default=200,
+                        help="rows to run through the compile stage per size (0 skips it)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel compiles (default: CPU count)")
+    parser.add_argument("--xelatex", help="TeX engine to time instead of the built-in stub")
+    parser.add_argument("--template", default="certificate_template.tex")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="certificate_benchmark_") as work_dir:
+        xelatex = args.xelatex or write_stub_xelatex(work_dir)
+        generator = CertificateGenerator(args.template, xelatex=xelatex)
+        for size in sizes:
+            benchmark_size(generator, size, work_dir, args.compile_rows, args.workers, results)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "xelatex": args.xelatex or "stub",
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
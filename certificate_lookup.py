@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Certificate Lookup
+Looks up issued certificates in the certificate index, e.g. to answer a
+verification request.
+
+Usage:
+    certificate_lookup.py K7QX-M2PA-9TDE            the certificate with this ID
+    certificate_lookup.py --name "Lincoln Abr"      certificates by name (prefix, any case)
+    certificate_lookup.py --name Lincoln --course "Neuro-AI: Artificial Intelligence ..."
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from generate_certificates import CertificateIndex
+
+
+def main():
+    """Query the certificate index."""
+    parser = argparse.ArgumentParser(description="Look up issued certificates")
+    parser.add_argument("id", nargs="?", help="certificate ID")
+    parser.add_argument("--name", help="name or the start of it")
+    parser.add_argument("--course", help="only certificates of this course (workshop title)")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--index", default="output/certificate_index.sqlite")
+    parser.add_argument("--json", action="store_true", help="print the records as JSON")
+    args = parser.parse_args()
+    if not args.id and args.name is None:
+        parser.error("give a certificate ID or --name")
+    if not os.path.exists(args.index):
+        print(f"Certificate index '{args.index}' not found.")
+        sys.exit(2)
+
+    index = CertificateIndex(args.index)
+    try:
+        if args.id:
+            certificate = index.lookup(args.id)
+            certificates = [certificate] if certificate else []
+        else:
+            certificates = index.find(args.name, course=args.course, limit=args.limit)
+    finally:
+        index.close()
+
+    if args.json:
+        print(json.dumps(certificates, indent=2, ensure_ascii=False))
+    elif not certificates:
+        print("No matching certificate found.")
+    for certificate in certificates if not args.json else []:
+        print(f"{certificate['id']}  {certificate['name']}  {certificate['course']}  "
+              f"completed {certificate['completion_date']}  issued {certificate['issued_at']}")
+    sys.exit(0 if certificates else 1)
+
+
+if __name__ == "__main__":
+    main()
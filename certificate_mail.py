@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Certificate Mail
+Emails certificates as they are generated, over a small pool of persistent
+SMTP connections, with a ledger so a rerun does not send anything twice.
+
+Usage:
+    mailer = CertificateMailer(host="smtp.example.org", port=587, starttls=True, ...)
+    generator.generate_individual_certificates_from_csv(
+        "names.csv", on_result=email_on_result(mailer, "names.csv"), ...)
+    mailer.close()
+
+The address of every participant is read from the roster's email column.
+"""
+
+import os
+import json
+import time
+import queue
+import smtplib
+import threading
+import collections
+from email.message import EmailMessage
+
+from generate_certificates import CertificateGenerator
+
+
+class CertificateMailer:
+    """Emails certificates over a small pool of persistent SMTP connections.
+
+    send() queues a certificate and returns right away; `connections` sender
+    threads each keep one SMTP connection open and deliver from the queue, at
+    most `rate` messages per second in total if rate is set. Temporary errors
+    (dropped connections, 4xx replies) are retried up to max_attempts times
+    with a growing delay; 5xx replies are final. Every outcome is appended to
+    the JSON-lines ledger, and addresses already marked as sent there are
+    skipped, so a rerun does not send a certificate twice. subject and body
+    may use {name}.
+    """
+    def __init__(self, host: str = "localhost", port: int = 25, sender: str = "certificates@localhost",
+                 subject: str = "Your certificate", body: str = "Dear {name},\n\nplease find your certificate attached.\n",
+                 username: str = None, password: str = None, starttls: bool = False, connections: int = 4,
+                 rate: float = None, max_attempts: int = 3, retry_delay: float = 5.0,
+                 ledger: str = "output/email_ledger.jsonl", queue_size: int = 100):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.subject = subject
+        self.body = body
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.rate = rate
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.ledger = ledger
+        self.counts = collections.Counter()
+        self._sent = set()
+        if os.path.exists(ledger):
+            with open(ledger, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["status"] == "sent":
+                        self._sent.add(entry["key"])
+        if os.path.dirname(ledger):
+            os.makedirs(os.path.dirname(ledger), exist_ok=True)
+        self._ledger_file = open(ledger, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._next_send = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._sender, daemon=True) for _ in range(max(1, connections))]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def _key(address: str, pdf_path: str) -> str:
+        return f"{address.lower()} {os.path.basename(pdf_path)}"
+
+    def send(self, index: int, name: str, address: str, pdf_path: str):
+        """Queue pdf_path for address (blocks while the queue is full). The PDF is read right away."""
+        key = self._key(address, pdf_path)
+        if not address or "@" not in address:
+            self._record(key, index, name, address, "failed", f"no valid email address '{address}'")
+            return
+        if key in self._sent:
+            with self._lock:
+                self.counts["already_sent"] += 1
+            return
+        with open(pdf_path, 'rb') as f:
+            attachment = f.read()
+        self._queue.put((index, name, address, os.path.basename(pdf_path), attachment))
+
+    def close(self) -> dict:
+        """Wait until every queued certificate is delivered or failed; returns counts by outcome."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._ledger_file.close()
+        print("Email delivery: " + ", ".join(f"{count} {status}" for status, count in sorted(self.counts.items())))
+        return dict(self.counts)
+
+    def _record(self, key: str, index: int, name: str, address: str, status: str, error: str = None):
+        with self._lock:
+            self.counts[status] += 1
+            if status == "sent":
+                self._sent.add(key)
+            self._ledger_file.write(json.dumps({"key": key, "row": index, "name": name, "email": address,
+                                                "status": status, "error": error, "time": time.time()}) + "\n")
+            self._ledger_file.flush()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=60)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _wait_for_rate_limit(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + 1 / self.rate
+        time.sleep(send_at - now)
+
+    def _sender(self):
+        connection = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, name, address, filename, attachment = item
+            message = EmailMessage()
+            message["From"] = self.sender
+            message["To"] = address
+            message["Subject"] = self.subject.format(name=name)
+            message.set_content(self.body.format(name=name))
+            message.add_attachment(attachment, maintype="application", subtype="pdf", filename=filename)
+            error = None
+            for attempt in range(1, self.max_attempts + 1):
+                self._wait_for_rate_limit()
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    connection.send_message(message)
+                    error = None
+                    break
+                except smtplib.SMTPResponseException as e:
+                    error = f"{e.smtp_code} {e.smtp_error.decode('utf-8', 'replace')}"
+                    if e.smtp_code >= 500:
+                        break
+                except smtplib.SMTPRecipientsRefused as e:
+                    code, reply = e.recipients[address]
+                    error = f"{code} {reply.decode('utf-8', 'replace')}"
+                    if code >= 500:
+                        break
+                except (smtplib.SMTPException, OSError) as e:
+                    error = f"{type(e).__name__}: {e}"
+                    # The connection may be broken; start a new one for the next attempt
+                    if connection is not None:
+                        try:
+                            connection.close()
+                        except Exception:
+                            pass
+                        connection = None
+                if attempt < self.max_attempts:
+                    time.sleep(self.retry_delay * attempt)
+            self._record(self._key(address, filename), index, name, address,
+                         "failed" if error else "sent", error)
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+
+class _RosterAddresses:
+    """Email addresses of a roster by row index, read only as far as the rows that asked for one.
+
+    Results arrive roughly in roster order, so only the addresses of the rows
+    still being compiled are held in memory.
+    """
+    def __init__(self, roster_file: str, email_column: str = "email"):
+        self._rows = CertificateGenerator._iter_rows(roster_file, skipinitialspace=True)
+        self._email_column = email_column
+        self._pending = {}
+        self._read = 0
+        self._lock = threading.Lock()
+
+    def pop(self, index: int) -> str:
+        with self._lock:
+            while self._read <= index:
+                row = next(self._rows, None)
+                self._pending[self._read] = "" if row is None else (row.get(self._email_column) or "").strip()
+                self._read += 1
+            return self._pending.pop(index, "")
+
+    def discard(self, index: int):
+        """Forget the address of a row that got no PDF, if it has been read already."""
+        with self._lock:
+            self._pending.pop(index, None)
+
+
+def email_on_result(mailer: CertificateMailer, roster_file: str, email_column: str = "email", on_result=None):
+    """Return an on_result callback for generate_individual_certificates that emails every finished PDF.
+
+    The PDF is queued (and read) before the generator moves it on, e.g. into
+    an archive. on_result, if given, is called afterwards with the same
+    arguments. The mailer is not closed here.
+    """
+    addresses = _RosterAddresses(roster_file, email_column)
+
+    def send(index, name, pdf_path, error):
+        if pdf_path:
+            mailer.send(index, name, addresses.pop(index), pdf_path)
+        else:
+            addresses.discard(index)
+        if on_result is not None:
+            on_result(index, name, pdf_path, error)
+
+    return send
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Certificate Job Queue
+Spreads one roster over any number of worker processes, on one or several
+machines, through a shared SQLite job store.
+
+Usage:
+    certificate_queue.py enqueue names.csv --event event.json   split the roster into jobs
+    certificate_queue.py work                                   drain the store (run on every node)
+    certificate_queue.py status                                 job and row counts
+
+Each job is a chunk of roster rows. A worker leases a job for --lease seconds
+and keeps extending the lease while it compiles; a job whose worker died is
+picked up again once its lease has expired. Rows that compiled are recorded,
+so a retried job (after a crash or a failed row) only compiles the rest, and
+a killed run continues where it stopped when the workers are started again.
+
+All nodes must see the store and the output directory at the same paths,
+e.g. on a shared file system with working file locks.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+
+from generate_certificates import CertificateGenerator
+
+# Options of generate_individual_certificates that the worker sets itself, or that need the whole
+# roster in one run (an incremental build or an archive would only ever see one chunk)
+WORKER_OPTIONS = ("output_dir", "tex_dir", "workers", "precompile_preamble", "on_result", "executor",
+                  "incremental", "archive", "archive_size")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    name TEXT PRIMARY KEY,
+    event TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    rows TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (batch, chunk)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, available_at);
+CREATE TABLE IF NOT EXISTS results (
+    job INTEGER NOT NULL,
+    row_index INTEGER NOT NULL,
+    name TEXT,
+    pdf TEXT,
+    error TEXT,
+    PRIMARY KEY (job, row_index)
+);
+"""
+
+
+class JobStore:
+    def __init__(self, path: str, timeout: float = 60.0):
+        """Open (and create if needed) the SQLite job store at path.
+
+        Transactions are explicit; claims use BEGIN IMMEDIATE so that two
+        workers never lease the same job.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # The heartbeat thread shares the connection
+        self.lock = threading.Lock()
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self, statements):
+        """Run statements(cursor) in one write transaction and return its result."""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(cursor)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            return result
+
+    def enqueue(self, batch: str, rows, event: dict, chunk_size: int = 50) -> int:
+        """Store the rows as jobs of chunk_size rows; returns the number of new jobs.
+
+        Enqueueing the same batch again adds nothing for chunks that already
+        exist, so an interrupted enqueue can simply be repeated. Raises
+        ValueError if event sets any of WORKER_OPTIONS.
+        """
+        reserved = sorted(set(event) & set(WORKER_OPTIONS))
+        if reserved:
+            raise ValueError(f"The event sets options the queue workers control: {', '.join(reserved)}")
+
+        def chunks():
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        def insert(cursor):
+            cursor.execute("INSERT OR REPLACE INTO batches (name, event) VALUES (?, ?)", (batch, json.dumps(event)))
+            added = 0
+            for number, chunk in enumerate(chunks()):
+                cursor.execute("INSERT OR IGNORE INTO jobs (batch, chunk, rows) VALUES (?, ?, ?)",
+                               (batch, number, json.dumps(chunk)))
+                added += cursor.rowcount
+            return added
+
+        return self._transaction(insert)
+
+    def claim(self, owner: str, lease: float, max_attempts: int):
+        """Lease the next pending job, or one whose lease expired; returns the job row or None."""
+        def claim_job(cursor):
+            now = time.time()
+            # A job whose worker died on its last attempt is not retried again
+            cursor.execute("UPDATE jobs SET status = 'failed', lease_owner = NULL, error = 'lease expired' "
+                           "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, max_attempts))
+            job = cursor.execute(
+                "SELECT * FROM jobs WHERE attempts < ? AND ("
+                "(status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?)"
+                ") ORDER BY id LIMIT 1",
+                (max_attempts, now, now)
+            ).fetchone()
+            if job is None:
+                return None
+            cursor.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                           "attempts = attempts + 1 WHERE id = ?", (owner, now + lease, job["id"]))
+            return job
+
+        return self._transaction(claim_job)
+
+    def heartbeat(self, job_id: int, owner: str, lease: float) -> bool:
+        """Extend the lease; False if the job is no longer leased by owner."""
+        def extend(cursor):
+            cursor.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                           (time.time() + lease, job_id, owner))
+            return cursor.rowcount == 1
+
+        return self._transaction(extend)
+
+    def record_result(self, job_id: int, row_index: int, name: str, pdf: str, error: str):
+        def record(cursor):
+            cursor.execute("INSERT OR REPLACE INTO results (job, row_index, name, pdf, error) VALUES (?, ?, ?, ?, ?)",
+                           (job_id, row_index, name, pdf, error))
+
+        self._transaction(record)
+
+    def done_rows(self, job_id: int) -> set:
+        with self.lock:
+            return {row["row_index"] for row in self.connection.execute(
+                "SELECT row_index FROM results WHERE job = ? AND pdf IS NOT NULL", (job_id,))}
+
+    def finish(self, job_id: int, owner: str, error: str, max_attempts: int, retry_delay: float):
+        """Mark the job done, or put it back for a retry (failed for good after max_attempts)."""
+        def update(cursor):
+            job = cursor.execute("SELECT attempts, lease_owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job["lease_owner"] != owner:
+                # The lease expired and another worker took over; its outcome counts
+                return
+            if error is None:
+                status = "done"
+            elif job["attempts"] >= max_attempts:
+                status = "failed"
+            else:
+                status = "pending"
+            cursor.execute("UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                           "available_at = ?, error = ? WHERE id = ?",
+                           (status, time.time() + retry_delay, error, job_id))
+
+        self._transaction(update)
+
+    def counts(self) -> dict:
+        """Job counts by status, with leases that ran out counted as 'expired', plus row totals."""
+        with self.lock:
+            now = time.time()
+            counts = {}
+            for row in self.connection.execute(
+                    "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'expired' ELSE status END AS state, "
+                    "COUNT(*) AS jobs FROM jobs GROUP BY state", (now,)):
+                counts[row["state"]] = row["jobs"]
+            rows = self.connection.execute(
+                "SELECT COUNT(pdf) AS generated, COUNT(*) - COUNT(pdf) AS failed FROM results").fetchone()
+            counts["rows_generated"] = rows["generated"]
+            counts["rows_failed"] = rows["failed"]
+            return counts
+
+    def batch_event(self, batch: str) -> dict:
+        with self.lock:
+            row = self.connection.execute("SELECT event FROM batches WHERE name = ?", (batch,)).fetchone()
+        return json.loads(row["event"]) if row else {}
+
+
+class QueueWorker:
+    def __init__(self, store: JobStore, generator: CertificateGenerator,
+                 output_dir: str = "output/pdfs",
+                 workers: int = None,
+                 lease: float = 300.0,
+                 max_attempts: int = 3,
+                 retry_delay: float = 30.0,
+                 poll_interval: float = 5.0,
+                 precompile_preamble: bool = True):
+        """Drain a JobStore, compiling each leased job's rows with generator.
+
+        Every worker process compiles in its own tex directory under output/
+        (the template refers to assets two levels up) and writes the PDFs to
+        the shared output_dir. A lease is extended every lease/3 seconds while
+        its job compiles.
+        """
+        self.store = store
+        self.generator = generator
+        self.output_dir = output_dir
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.precompile_preamble = precompile_preamble
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.tex_dir = os.path.join("output", f"tex-{self.owner}")
+        self.events = {}
+
+    def run(self) -> int:
+        """Work until no job is left to claim; returns the number of jobs this worker finished."""
+        finished = 0
+        while True:
+            job = self.store.claim(self.owner, self.lease, self.max_attempts)
+            if job is None:
+                counts = self.store.counts()
+                if not counts.get("pending") and not counts.get("leased") and not counts.get("expired"):
+                    return finished
+                # Others still hold leases (or retries are waiting); any of them may come back
+                time.sleep(self.poll_interval)
+                continue
+            self._run_job(job)
+            finished += 1
+
+    def _run_job(self, job):
+        print(f"Job {job['id']} ({job['batch']} chunk {job['chunk']}), attempt {job['attempts'] + 1}")
+        lease_lost = threading.Event()
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease / 3):
+                if not self.store.heartbeat(job["id"], self.owner, self.lease):
+                    lease_lost.set()
+                    return
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            error = self._compile_rows(job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+        if lease_lost.is_set():
+            print(f"Job {job['id']}: lease lost to another worker")
+        self.store.finish(job["id"], self.owner, error, self.max_attempts, self.retry_delay)
+
+    def _compile_rows(self, job) -> str:
+        """Compile the job's rows that have no PDF yet; returns None or an error summary."""
+        rows = json.loads(job["rows"])
+        done = self.store.done_rows(job["id"])
+        todo = [index for index in range(len(rows)) if index not in done]
+        if not todo:
+            return None
+        if job["batch"] not in self.events:
+            # Batches stored before WORKER_OPTIONS were rejected may still carry them
+            self.events[job["batch"]] = {key: value for key, value in self.store.batch_event(job["batch"]).items()
+                                         if key not in WORKER_OPTIONS}
+        participants = list(self.generator.participants_from_rows(rows[index] for index in todo))
+        failures = []
+
+        def on_result(index, name, pdf_path, error):
+            if pdf_path is None:
+                failures.append(name)
+            self.store.record_result(job["id"], todo[index], name, pdf_path,
+                                     None if pdf_path else str(error or "PDF compilation failed"))
+
+        self.generator.generate_individual_certificates(
+            participants,
+            output_dir=self.output_dir,
+            tex_dir=self.tex_dir,
+            workers=self.workers,
+            precompile_preamble=self.precompile_preamble,
+            # Every chunk would rewrite the build manifest with its own rows and delete the others' PDFs
+            incremental=False,
+            on_result=on_result,
+            **self.events[job["batch"]]
+        )
+        if failures:
+            return f"{len(failures)} row(s) failed: " + ", ".join(failures[:5])
+        return None
+
+
+def main():
+    """Enqueue a roster, work on the queue, or show its status."""
+    parser = argparse.ArgumentParser(description="Shared job queue for certificate generation")
+    parser.add_argument("--db", default="output/certificate_jobs.sqlite", help="SQLite job store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="split a roster (CSV or JSON lines) into jobs")
+    enqueue.add_argument("roster")
+    enqueue.add_argument("--batch", help="batch name (default: the roster file name)")
+    enqueue.add_argument("--event", help="JSON file with the shared certificate fields (workshop_title, tutors, ...)")
+    enqueue.add_argument("--chunk-size", type=int, default=50, help="roster rows per job")
+    work = commands.add_parser("work", help="compile jobs until the queue is drained")
+    work.add_argument("--template", default="certificate_template.tex")
+    work.add_argument("--output-dir", default="output/pdfs")
+    work.add_argument("--workers", type=int, default=None, help="parallel compiles (default: CPU count)")
+    work.add_argument("--lease", type=float, default=300.0, help="seconds a job stays leased without a heartbeat")
+    work.add_argument("--max-attempts", type=int, default=3, help="attempts per job before it is marked failed")
+    work.add_argument("--retry-delay", type=float, default=30.0, help="seconds before a failed job is retried")
+    work.add_argument("--no-precompile", action="store_true", help="do not precompile the template preamble")
+    commands.add_parser("status", help="show job and row counts")
+    args = parser.parse_args()
+
+    if os.path.dirname(args.db):
+        os.makedirs(os.path.dirname(args.db), exist_ok=True)
+    store = JobStore(args.db)
+    try:
+        if args.command == "enqueue":
+            event = {}
+            if args.event:
+                with open(args.event, 'r', encoding='utf-8') as f:
+                    event = json.load(f)
+            batch = args.batch or os.path.basename(args.roster)
+            rows = CertificateGenerator._iter_rows(args.roster, skipinitialspace=True)
+            try:
+                added = store.enqueue(batch, rows, event, chunk_size=max(1, args.chunk_size))
+            except ValueError as e:
+                print(e)
+                sys.exit(2)
+            print(f"Enqueued {added} new job(s) for batch {batch}")
+        elif args.command == "work":
+            worker = QueueWorker(
+                store,
+                CertificateGenerator(args.template),
+                output_dir=args.output_dir,
+                workers=args.workers,
+                lease=args.lease,
+                max_attempts=args.max_attempts,
+                retry_delay=args.retry_delay,
+                precompile_preamble=not args.no_precompile,
+            )
+            finished = worker.run()
+            print(f"Queue drained, {finished} job(s) run by this worker")
+        counts = store.counts()
+        print(", ".join(f"{state}: {count}" for state, count in sorted(counts.items())))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
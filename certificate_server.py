@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Certificate Rendering Service
+Keeps a CertificateGenerator warm and renders certificates on request over a
+small local HTTP API (TCP or Unix socket), so single late certificates do not
+pay Python and TeX start-up every time.
+
+API:
+    POST /certificates       one roster row as JSON -> the PDF (waits for it)
+    POST /jobs               one row or a list of rows -> {"jobs": [ids]}
+    GET  /jobs/<id>          job status as JSON
+    GET  /jobs/<id>/pdf      the PDF of a finished job
+    GET  /verify/<id>        the issued certificate with this ID (with --index)
+    GET  /health             queue and worker status
+
+Rows use the same keys as the CSV columns, e.g.
+    {"Lastname": "Lincoln", "Name": "Abraham", "completion_date": "1809-02-12"}
+"""
+
+import os
+import sys
+import json
+import uuid
+import shutil
+import asyncio
+import argparse
+import collections
+
+from generate_certificates import CertificateGenerator, CertificateIndex
+
+# Status line texts for the responses the service sends
+HTTP_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    422: "Unprocessable Entity",
+    503: "Service Unavailable",
+}
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Options of generate_individual_certificates that the service sets itself, or that would act on the
+# per-worker output directories, which on_result empties as soon as each PDF is ready
+SERVICE_OPTIONS = ("output_dir", "tex_dir", "workers", "single_compile", "precompile_preamble", "on_result",
+                   "certificate_index", "executor", "incremental", "archive", "archive_size")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class CertificateService:
+    def __init__(self, generator: CertificateGenerator, event: dict = None,
+                 work_dir: str = "output/server",
+                 workers: int = None,
+                 queue_size: int = 1000,
+                 batch_size: int = 16,
+                 batch_window: float = 0.05,
+                 precompile_preamble: bool = True,
+                 max_finished_jobs: int = 10000,
+                 certificate_index: CertificateIndex = None):
+        """Render certificates for queued rows on a pool of warm workers.
+
+        event holds the certificate fields shared by every row (the keyword
+        arguments of generate_individual_certificates, e.g. workshop_title).
+        Each worker collects up to batch_size queued rows, waiting at most
+        batch_window seconds for more to arrive, and renders them as one batch.
+        Every worker compiles in its own directory under output/, since the
+        template refers to assets two levels up (../../certificate_base_page.png).
+        With a certificate_index, rendered certificates are recorded there and
+        can be verified with GET /verify/<id>. Raises ValueError if event sets
+        any of SERVICE_OPTIONS.
+        """
+        reserved = sorted(set(event or {}) & set(SERVICE_OPTIONS))
+        if reserved:
+            raise ValueError(f"The event sets options the service controls: {', '.join(reserved)}")
+        self.generator = generator
+        self.event = event or {}
+        self.work_dir = work_dir
+        self.results_dir = os.path.join(work_dir, "results")
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.precompile_preamble = precompile_preamble
+        self.max_finished_jobs = max_finished_jobs
+        self.certificate_index = certificate_index
+        self.queue = None
+        self.jobs = collections.OrderedDict()
+        self.fmt_name = None
+        self._tasks = []
+
+    async def start(self):
+        """Warm up (parse template, dump the preamble format) and start the workers."""
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.precompile_preamble:
+            loop = asyncio.get_running_loop()
+            self.fmt_name = await loop.run_in_executor(None, self.generator._ensure_preamble_format, "output/tex")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, rows: list) -> list:
+        """Queue rows for rendering and return their job records."""
+        if self.queue.maxsize - self.queue.qsize() < len(rows):
+            raise QueueFullError(f"queue is full ({self.queue.qsize()} rows waiting)")
+        loop = asyncio.get_running_loop()
+        submitted = []
+        for row in rows:
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "queued",
+                "row": row,
+                "name": None,
+                "pdf": None,
+                "error": None,
+                "done": loop.create_future(),
+            }
+            self.jobs[job["id"]] = job
+            self.queue.put_nowait(job)
+            submitted.append(job)
+        return submitted
+
+    async def _worker(self, worker_id: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            for job in batch:
+                job["status"] = "running"
+            try:
+                await loop.run_in_executor(None, self._render_batch, worker_id, batch, loop)
+            except Exception as e:
+                for job in batch:
+                    if not job["done"].done():
+                        self._finish(job, None, f"{type(e).__name__}: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                self._forget_old_jobs()
+
+    def _render_batch(self, worker_id: int, batch: list, loop):
+        """Render one batch on an executor thread; each worker has its own build directories."""
+        participants = list(self.generator.participants_from_rows(job["row"] for job in batch))
+        for job, (name, _) in zip(batch, participants):
+            job["name"] = name
+
+        def on_result(index, name, pdf_path, error):
+            job = batch[index]
+            result_path = None
+            if pdf_path:
+                # Move the PDF out right away, before a later row with the same name overwrites it
+                result_path = os.path.join(self.results_dir, f"{job['id']}.pdf")
+                shutil.move(pdf_path, result_path)
+            elif error is None:
+                error = "PDF compilation failed"
+            loop.call_soon_threadsafe(self._finish, job, result_path, None if error is None else str(error))
+
+        names = [name for name, _ in participants]
+        self.generator.generate_individual_certificates(
+            participants,
+            output_dir=os.path.join(self.work_dir, f"worker-{worker_id}"),
+            tex_dir=os.path.join("output", f"tex-worker-{worker_id}"),
+            workers=1,
+            # One xelatex run per batch; rows sharing a name would share an output file, so those compile one by one
+            single_compile=len(batch) > 1 and len(set(names)) == len(names),
+            precompile_preamble=self.fmt_name is not None,
+            on_result=on_result,
+            certificate_index=self.certificate_index,
+            **self.event
+        )
+
+    def _finish(self, job: dict, pdf_path: str, error: str):
+        if job["done"].done():
+            return
+        job["pdf"] = pdf_path
+        job["error"] = error
+        job["status"] = "done" if pdf_path else "failed"
+        job["done"].set_result(job)
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs (and their PDFs) beyond max_finished_jobs."""
+        finished = sum(1 for job in self.jobs.values() if job["done"].done())
+        for job_id in list(self.jobs):
+            if finished <= self.max_finished_jobs:
+                break
+            job = self.jobs[job_id]
+            if not job["done"].done():
+                continue
+            del self.jobs[job_id]
+            finished -= 1
+            if job["pdf"] and os.path.exists(job["pdf"]):
+                os.remove(job["pdf"])
+
+    @staticmethod
+    def job_status(job: dict) -> dict:
+        return {key: job[key] for key in ("id", "status", "name", "error")}
+
+    # HTTP handling
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            self._write_response(writer, 400, "application/json", json.dumps({"error": str(e)}).encode(), False)
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(" ", 2)
+        except ValueError:
+            raise ValueError("malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode('latin-1').partition(":")
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, content_type: str, payload: bytes,
+                        keep_alive: bool):
+        headers = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + payload)
+
+    async def _dispatch(self, method: str, path: str, body: bytes):
+        def as_json(status, data):
+            return status, "application/json", json.dumps(data).encode('utf-8')
+
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            return as_json(200, {"queued": self.queue.qsize(), "workers": self.workers,
+                                 "precompiled_preamble": self.fmt_name is not None})
+        if parts in (["certificates"], ["jobs"]):
+            if method != "POST":
+                return as_json(405, {"error": "use POST"})
+            try:
+                rows = json.loads(body.decode('utf-8') or "null")
+            except ValueError as e:
+                return as_json(400, {"error": f"invalid JSON: {e}"})
+            if isinstance(rows, dict):
+                rows = [rows]
+            if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+                return as_json(400, {"error": "expected a JSON object or a non-empty list of objects"})
+            if parts == ["certificates"] and len(rows) != 1:
+                return as_json(400, {"error": "POST /certificates takes a single row, use /jobs for batches"})
+            rows = [{str(key): "" if value is None else str(value) for key, value in row.items()} for row in rows]
+            try:
+                jobs = self.submit(rows)
+            except QueueFullError as e:
+                return as_json(503, {"error": str(e)})
+            if parts == ["jobs"]:
+                return as_json(202, {"jobs": [job["id"] for job in jobs]})
+            job = await jobs[0]["done"]
+            if job["status"] != "done":
+                return as_json(422, self.job_status(job))
+            with open(job["pdf"], 'rb') as f:
+                return 200, "application/pdf", f.read()
+        if len(parts) == 2 and parts[0] == "verify" and method == "GET" and self.certificate_index is not None:
+            certificate = self.certificate_index.lookup(parts[1])
+            if certificate is None:
+                return as_json(404, {"error": "unknown certificate ID"})
+            return as_json(200, {key: certificate[key] for key in ("id", "name", "course", "date_range",
+                                                                    "completion_date", "issued_at")})
+        if len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return as_json(404, {"error": "unknown job"})
+            if len(parts) == 2:
+                return as_json(200, self.job_status(job))
+            if parts[2] == "pdf":
+                if job["status"] != "done":
+                    return as_json(409, self.job_status(job))
+                with open(job["pdf"], 'rb') as f:
+                    return 200, "application/pdf", f.read()
+        return as_json(404, {"error": "not found"})
+
+
+async def serve(args):
+    generator = CertificateGenerator(args.template)
+    event = {}
+    if args.event:
+        with open(args.event, 'r', encoding='utf-8') as f:
+            event = json.load(f)
+    certificate_index = CertificateIndex(args.index) if args.index else None
+    try:
+        service = CertificateService(
+            generator,
+            event=event,
+            work_dir=args.work_dir,
+            workers=args.workers,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            batch_window=args.batch_window,
+            precompile_preamble=not args.no_precompile,
+            certificate_index=certificate_index,
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(2)
+    print("Warming up certificate workers...")
+    await service.start()
+    if args.unix:
+        server = await asyncio.start_unix_server(service.handle_connection, path=args.unix)
+        print(f"Serving certificates on unix socket {args.unix}")
+    else:
+        server = await asyncio.start_server(service.handle_connection, args.host, args.port)
+        print(f"Serving certificates on http://{args.host}:{args.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+        if certificate_index is not None:
+            certificate_index.close()
+
+
+def main():
+    """Run the certificate rendering service."""
+    parser = argparse.ArgumentParser(description="Local certificate rendering service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--template", default="certificate_template.tex")
+    parser.add_argument("--event", help="JSON file with the shared certificate fields (workshop_title, tutors, ...)")
+    parser.add_argument("--work-dir", default="output/server")
+    parser.add_argument("--workers", type=int, default=None, help="parallel compile workers (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=1000, help="maximum number of waiting rows")
+    parser.add_argument("--batch-size", type=int, default=16, help="maximum rows rendered in one batch")
+    parser.add_argument("--batch-window", type=float, default=0.05,
+                        help="seconds a worker waits for more rows before rendering a batch")
+    parser.add_argument("--no-precompile", action="store_true", help="do not precompile the template preamble")
+    parser.add_argument("--index", help="record certificates in this certificate index and serve /verify/<id>")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("Certificate service stopped.")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,701 @@ Generates LaTeX certificates for multiple people from a list of names.
 """
 
 import os
+import re
 import datetime
+import io
+import base64
+import hashlib
+import json
+import argparse
+import time
+import shutil
+import signal
+import sqlite3
+import subprocess
+import tempfile
+import itertools
+import threading
+import collections
+import concurrent.futures
 from typing import List
 
+
+class CompiledTemplate:
+    """A template parsed once into literal segments and {{KEY}} placeholder slots.
+
+    Rendering joins the segments with the field values, so each certificate costs
+    one pass over the template instead of one str.replace per field. Placeholders
+    without a value are left in the output unchanged, as fill_template always did.
+    """
+    PLACEHOLDER_PATTERN = re.compile(r"\{\{([A-Za-z0-9_]+)\}\}")
+
+    def __init__(self, text: str):
+        # literals[i] comes before keys[i]; there is always one more literal than keys
+        self.literals = []
+        self.keys = []
+        position = 0
+        for match in self.PLACEHOLDER_PATTERN.finditer(text):
+            self.literals.append(text[position:match.start()])
+            self.keys.append(match.group(1))
+            position = match.end()
+        self.literals.append(text[position:])
+
+    @classmethod
+    def _from_segments(cls, literals: list, keys: list) -> "CompiledTemplate":
+        compiled = cls.__new__(cls)
+        compiled.literals = literals
+        compiled.keys = keys
+        return compiled
+
+    def render(self, fields: dict) -> str:
+        parts = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            value = fields.get(key)
+            parts.append(f"{{{{{key}}}}}" if value is None else value)
+            parts.append(literal)
+        return "".join(parts)
+
+    def partial(self, fields: dict) -> "CompiledTemplate":
+        """Return a template with the given fields filled in and the other slots kept."""
+        literals = [self.literals[0]]
+        keys = []
+        for key, literal in zip(self.keys, self.literals[1:]):
+            if key in fields:
+                literals[-1] += fields[key] + literal
+            else:
+                keys.append(key)
+                literals.append(literal)
+        return self._from_segments(literals, keys)
+
+    def body(self, start_marker: str = r"\begin{document}", end_marker: str = r"\end{document}"):
+        """Return the part between the document markers as a template, or None if they are missing."""
+        placeholder_free = self.render({key: "" for key in self.keys})
+        if start_marker not in placeholder_free or end_marker not in placeholder_free:
+            return None
+        # The markers are plain text, so they live inside literal segments
+        literals = list(self.literals)
+        keys = list(self.keys)
+        for i, literal in enumerate(literals):
+            if start_marker in literal:
+                literals = literals[i:]
+                keys = keys[i:]
+                literals[0] = literals[0][literals[0].find(start_marker) + len(start_marker):].lstrip()
+                break
+        for i, literal in enumerate(literals):
+            if end_marker in literal:
+                literals = literals[:i + 1]
+                keys = keys[:i]
+                literals[-1] = literals[-1][:literals[-1].find(end_marker)].rstrip()
+                break
+        return self._from_segments(literals, keys)
+
+
+class _CombinedWriter:
+    """Write parts of a document as they come, separated by blank lines.
+
+    Produces the same file as writing "\\n\\n".join(parts), without ever
+    holding more than one part in memory.
+    """
+    def __init__(self, output_file: str):
+        self.file = open(output_file, 'w', encoding='utf-8')
+        self.first = True
+
+    def append(self, part: str):
+        if not self.first:
+            self.file.write("\n\n")
+        self.file.write(part)
+        self.first = False
+
+    def close(self):
+        self.file.close()
+
+
+class _ArchiveWriter:
+    """Move finished PDFs into ZIP or tar archives as they come.
+
+    The archive type follows the extension of archive_path (.zip, .tar,
+    .tar.gz/.tgz). With per_archive set, a new archive is started every
+    per_archive PDFs (name-0001.zip, name-0002.zip, ...). Each archive ends
+    with a manifest.csv entry listing its rows, entries and SHA-256 sums, and
+    a manifest for all archives is written next to them (name.csv). Archives
+    are written under a .tmp name and renamed when complete.
+    """
+    MANIFEST_COLUMNS = ["row", "name", "archive", "entry", "size", "sha256"]
+
+    def __init__(self, archive_path: str, per_archive: int = None):
+        import csv
+        for extension in (".tar.gz", ".tgz", ".tar", ".zip"):
+            if archive_path.endswith(extension):
+                self.base, self.extension = archive_path[:-len(extension)], extension
+                break
+        else:
+            raise ValueError(f"Unsupported archive type '{archive_path}', expected .zip, .tar, .tar.gz or .tgz")
+        self.per_archive = per_archive
+        self.archive_paths = []
+        self._archive = None
+        self._entries = []
+        self._entry_names = set()
+        directory = os.path.dirname(archive_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._manifest_file = open(f"{self.base}.csv", 'w', newline='', encoding='utf-8')
+        self._manifest = csv.writer(self._manifest_file)
+        self._manifest.writerow(self.MANIFEST_COLUMNS)
+
+    def _open_archive(self):
+        import tarfile
+        import zipfile
+        if self.per_archive:
+            path = f"{self.base}-{len(self.archive_paths) + 1:04d}{self.extension}"
+        else:
+            path = f"{self.base}{self.extension}"
+        self.archive_paths.append(path)
+        if self.extension == ".zip":
+            # PDFs are compressed already
+            self._archive = zipfile.ZipFile(path + ".tmp", 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(path + ".tmp", 'w' if self.extension == ".tar" else 'w:gz')
+
+    def _write_entry(self, entry: str, data: bytes):
+        import tarfile
+        if isinstance(self._archive, tarfile.TarFile):
+            info = tarfile.TarInfo(entry)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._archive.addfile(info, io.BytesIO(data))
+        else:
+            self._archive.writestr(entry, data)
+
+    def add(self, row: int, name: str, pdf_path: str) -> str:
+        """Move pdf_path into the current archive; returns the archive it went to."""
+        if self._archive is None:
+            self._open_archive()
+        with open(pdf_path, 'rb') as f:
+            data = f.read()
+        entry = os.path.basename(pdf_path)
+        if entry in self._entry_names:
+            # Rows whose names map to the same file name (see validate) are kept apart by row number
+            entry = f"{os.path.splitext(entry)[0]}-{row + 1}.pdf"
+        self._entry_names.add(entry)
+        self._write_entry(entry, data)
+        os.remove(pdf_path)
+        record = [row + 1, name, os.path.basename(self.archive_paths[-1]), entry, len(data),
+                  hashlib.sha256(data).hexdigest()]
+        self._entries.append(record)
+        self._manifest.writerow(record)
+        archive_path = self.archive_paths[-1]
+        if self.per_archive and len(self._entries) >= self.per_archive:
+            self._close_archive()
+        return archive_path
+
+    def _close_archive(self):
+        import csv
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(self.MANIFEST_COLUMNS)
+        writer.writerows(self._entries)
+        self._write_entry("manifest.csv", manifest.getvalue().encode('utf-8'))
+        self._archive.close()
+        os.replace(self.archive_paths[-1] + ".tmp", self.archive_paths[-1])
+        self._archive = None
+        self._entries = []
+        self._entry_names = set()
+
+    def close(self) -> list:
+        """Finish the last archive and the manifest; returns the paths of all archives."""
+        if self._archive is not None:
+            self._close_archive()
+        self._manifest_file.close()
+        return self.archive_paths
+
+    def abort(self) -> str:
+        """Close an unfinished archive without renaming it; returns its .tmp path, or None.
+
+        The PDFs already moved into it stay there, and the archives finished
+        before it are kept.
+        """
+        partial = None
+        if self._archive is not None:
+            self._archive.close()
+            partial = self.archive_paths.pop() + ".tmp"
+            self._archive = None
+        self._manifest_file.close()
+        return partial
+
+
+class BuildInstrumentation:
+    """Per-row and per-stage timings and progress reporting for a batch run.
+
+    Stages are timed as they happen (parse, render, write_tex, xelatex, move,
+    cleanup, plus split for single-compile batches) and written, together with
+    one event per finished row, progress updates and a final summary, as JSON
+    lines to event_log. Progress with throughput and ETA is printed every
+    progress_interval seconds; the ETA needs total_rows. Every event dict is
+    also passed to each callable in hooks. If profile_file is set the run is
+    profiled with cProfile (the calling thread only) and the stats are dumped
+    there by finish().
+    """
+    def __init__(self, event_log: str = None, total_rows: int = None, progress_interval: float = 5.0,
+                 hooks: list = None, profile_file: str = None):
+        self.event_log = event_log
+        self.total_rows = total_rows
+        self.progress_interval = progress_interval
+        self.hooks = hooks or []
+        self.profile_file = profile_file
+        self.stage_totals = collections.defaultdict(float)
+        self.status_counts = collections.Counter()
+        self.rows_done = 0
+        self._row_stages = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._profiler = None
+        self._started = None
+        self._last_progress = None
+
+    def start(self):
+        self._started = self._last_progress = time.perf_counter()
+        if self.event_log:
+            os.makedirs(os.path.dirname(os.path.abspath(self.event_log)), exist_ok=True)
+            self._file = open(self.event_log, 'a', encoding='utf-8')
+        if self.profile_file:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.emit({"event": "start", "total_rows": self.total_rows})
+
+    def emit(self, event: dict):
+        event = dict(event, time=round(time.time(), 6))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        for hook in self.hooks:
+            hook(event)
+
+    def record(self, row, stage: str, seconds: float):
+        """Record the duration of one stage; row is the row index, or None for batch-wide stages."""
+        with self._lock:
+            self.stage_totals[stage] += seconds
+            if row is not None:
+                stages = self._row_stages.setdefault(row, {})
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        self.emit({"event": "stage", "row": row, "stage": stage, "seconds": round(seconds, 6)})
+
+    def row_done(self, row: int, name: str, status: str, pdf: str = None, error: str = None,
+                 output: str = None):
+        """Record a finished row; status is generated, up_to_date or failed."""
+        with self._lock:
+            stages = self._row_stages.pop(row, {})
+            self.rows_done += 1
+            self.status_counts[status] += 1
+        event = {"event": "row", "row": row, "name": name, "status": status, "pdf": pdf,
+                 "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()}}
+        if error:
+            event["error"] = error
+        if output:
+            event["output"] = output
+        self.emit(event)
+        now = time.perf_counter()
+        if now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.progress(now)
+
+    def progress(self, now: float = None):
+        elapsed = (now or time.perf_counter()) - self._started
+        rate = self.rows_done / elapsed if elapsed > 0 else 0.0
+        event = {"event": "progress", "rows_done": self.rows_done, "total_rows": self.total_rows,
+                 "elapsed_seconds": round(elapsed, 3), "rows_per_second": round(rate, 3)}
+        message = f"Progress: {self.rows_done}"
+        if self.total_rows:
+            remaining = max(0, self.total_rows - self.rows_done)
+            event["eta_seconds"] = round(remaining / rate, 1) if rate > 0 else None
+            message += f"/{self.total_rows}"
+        message += f" rows, {rate:.1f} rows/s"
+        if event.get("eta_seconds") is not None:
+            message += f", ETA {datetime.timedelta(seconds=int(event['eta_seconds']))}"
+        print(message)
+        self.emit(event)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            print(f"Profile written to {self.profile_file}")
+        summary = {"event": "summary", "rows_done": self.rows_done, "elapsed_seconds": round(elapsed, 3),
+                   "statuses": dict(self.status_counts),
+                   "stage_seconds": {stage: round(seconds, 6) for stage, seconds in self.stage_totals.items()}}
+        self.emit(summary)
+        print("Stage times: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in
+                                          sorted(self.stage_totals.items(), key=lambda item: -item[1])))
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return summary
+
+
+class CertificateSigner:
+    """Digitally signs finished certificate PDFs with pyHanko.
+
+    The key and certificate chain are loaded once, either from PEM/DER files
+    (key_file, cert_file, ca_chain_files) or from a PKCS#12 bundle
+    (pkcs12_file), and reused for every PDF. Each PDF gets an invisible
+    signature appended as an incremental update, so the compiled content is
+    left byte for byte unchanged. sign() may be called from several threads.
+    """
+    def __init__(self, key_file: str = None, cert_file: str = None, ca_chain_files: list = None,
+                 pkcs12_file: str = None, passphrase: str = None, field_name: str = "CertificateSignature",
+                 reason: str = None, location: str = None):
+        from pyhanko.sign import signers
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+        from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+        from pyhanko.sign.general import get_pyca_cryptography_hash
+        passphrase = passphrase.encode('utf-8') if passphrase is not None else None
+        if pkcs12_file:
+            loaded = signers.SimpleSigner.load_pkcs12(pkcs12_file, ca_chain_files=ca_chain_files,
+                                                      passphrase=passphrase)
+        else:
+            loaded = signers.SimpleSigner.load(key_file, cert_file, ca_chain_files=ca_chain_files,
+                                               key_passphrase=passphrase)
+        if loaded is None:
+            raise ValueError("Could not load the signing key and certificate")
+        # SimpleSigner parses the private key again for every signature, which costs
+        # more than the signature itself; RSA keys (the common case) are parsed once here
+        private_key = serialization.load_der_private_key(loaded.signing_key.dump(), password=None)
+
+        class PreloadedKeySigner(signers.SimpleSigner):
+            def sign_raw(self, data: bytes, digest_algorithm: str) -> bytes:
+                mechanism = self.get_signature_mechanism_for_digest(digest_algorithm).signature_algo
+                if mechanism == 'rsassa_pkcs1v15' and isinstance(private_key, RSAPrivateKey):
+                    return private_key.sign(data, PKCS1v15(), get_pyca_cryptography_hash(digest_algorithm))
+                return super().sign_raw(data, digest_algorithm)
+
+        self.signer = PreloadedKeySigner(signing_cert=loaded.signing_cert, signing_key=loaded.signing_key,
+                                         cert_registry=loaded.cert_registry,
+                                         signature_mechanism=loaded.signature_mechanism)
+        self.metadata = signers.PdfSignatureMetadata(field_name=field_name, reason=reason, location=location)
+        # Room for the hex-encoded signature container; without it pyHanko signs every PDF
+        # twice to measure it
+        self.bytes_reserved = 2 * (4096 + sum(len(cert.dump()) for cert in [loaded.signing_cert,
+                                                                            *loaded.cert_registry]))
+        # Identifies the signing certificate in the incremental build manifest
+        self.fingerprint = hashlib.sha256(loaded.signing_cert.dump()).hexdigest()
+
+    def sign(self, pdf_path: str) -> str:
+        """Sign pdf_path in place (atomically) and return it."""
+        from pyhanko.sign import signers
+        from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+        with open(pdf_path, 'rb') as source, open(pdf_path + ".tmp", 'wb') as target:
+            signers.sign_pdf(IncrementalPdfFileWriter(source), self.metadata, signer=self.signer,
+                             bytes_reserved=self.bytes_reserved, output=target)
+        os.replace(pdf_path + ".tmp", pdf_path)
+        return pdf_path
+
+
+class CertificateIndex:
+    """SQLite index of issued certificates, for verifying them by ID.
+
+    IDs are the primary key, so lookup() is a single index probe; find()
+    searches by (a prefix of the) name, optionally within one course, through
+    indexes on the case-folded name. Rows are written in batches of
+    batch_size by record() (and the rest by flush()). Issuing a certificate
+    again keeps its first issue time and updates where the PDF is.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS certificates (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL,
+        course TEXT NOT NULL,
+        date_range TEXT,
+        completion_date TEXT,
+        issued_at TEXT NOT NULL,
+        pdf TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS certificates_by_name ON certificates (name_key);
+    CREATE INDEX IF NOT EXISTS certificates_by_course ON certificates (course, name_key);
+    """
+    COLUMNS = ("id", "name", "course", "date_range", "completion_date", "issued_at", "pdf")
+
+    def __init__(self, path: str = "output/certificate_index.sqlite", batch_size: int = 1000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name_key(name: str) -> str:
+        return " ".join(name.casefold().split())
+
+    @staticmethod
+    def normalize_id(certificate_id: str) -> str:
+        """Accept IDs typed in any case, with or without dashes or spaces."""
+        code = re.sub(r"[^A-Z0-9]", "", certificate_id.upper())
+        return "-".join(code[i:i + 4] for i in range(0, len(code), 4))
+
+    def record(self, certificate_id: str, name: str, course: str, date_range: str, completion_date: str,
+               pdf: str = None):
+        with self._lock:
+            self._pending.append((certificate_id, name, self._name_key(name), course, date_range, completion_date,
+                                  datetime.datetime.now().isoformat(timespec="seconds"), pdf))
+            if len(self._pending) >= self.batch_size:
+                self._write_pending()
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO certificates (id, name, name_key, course, date_range, completion_date, issued_at, pdf) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET pdf = excluded.pdf",
+                self._pending
+            )
+        self._pending = []
+
+    def lookup(self, certificate_id: str):
+        """Return the certificate with this ID as a dict, or None."""
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM certificates WHERE id = ?",
+                (self.normalize_id(certificate_id),)
+            ).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def find(self, name: str = "", course: str = None, limit: int = 100) -> list:
+        """Return certificates whose name starts with name (ignoring case), optionally of one course."""
+        name_key = self._name_key(name)
+        # A range on name_key instead of LIKE, so the prefix search uses the index
+        query = f"SELECT {', '.join(self.COLUMNS)} FROM certificates WHERE name_key >= ? AND name_key < ?"
+        parameters = [name_key, name_key + "\U0010ffff"]
+        if course is not None:
+            query += " AND course = ?"
+            parameters.append(course)
+        query += " ORDER BY name_key LIMIT ?"
+        parameters.append(limit)
+        with self._lock:
+            rows = self.connection.execute(query, parameters).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+class _OverlayRenderer:
+    """Stamps per-person fields onto a pre-rendered base page, without TeX.
+
+    positions is a list of (field, x, y, size, bold) in PDF points, as measured
+    by xelatex when the base page was typeset (see
+    CertificateGenerator._prepare_overlay). Each certificate is the base page
+    with the field values drawn at those positions by reportlab. With qr_url,
+    a QR code of it (with {id} filled in) goes where _qr_code would put it.
+    """
+    # Helvetica has the same metrics as Arial, the template's font; reportlab draws it WinAnsi-encoded
+    DEFAULT_FONTS = {"regular": "Helvetica", "bold": "Helvetica-Bold"}
+    STANDARD_FONT_ENCODING = "cp1252"
+    # The same box as CertificateGenerator._qr_code: 2cm high, 3.5cm from the right and 1.5cm from the bottom edge
+    QR_SIZE = 2 * 72 / 2.54
+    QR_MARGINS = (3.5 * 72 / 2.54, 1.5 * 72 / 2.54)
+
+    def __init__(self, base_pdf: str, positions: list, fonts: dict = None, qr_url: str = None):
+        from pypdf import PdfReader
+        self.base_pdf = base_pdf
+        self.positions = positions
+        self.qr_url = qr_url
+        with open(base_pdf, 'rb') as f:
+            self.base_bytes = f.read()
+        mediabox = PdfReader(io.BytesIO(self.base_bytes)).pages[0].mediabox
+        self.page_size = (float(mediabox.width), float(mediabox.height))
+        self.fonts = self._register_fonts(fonts or {})
+
+    @classmethod
+    def _register_fonts(cls, fonts: dict) -> dict:
+        """Register TrueType files given as {"regular": path, "bold": path}; other styles use DEFAULT_FONTS."""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        registered = dict(cls.DEFAULT_FONTS)
+        for style, font_file in fonts.items():
+            font_name = f"CertificateOverlay-{style}"
+            pdfmetrics.registerFont(TTFont(font_name, font_file))
+            registered[style] = font_name
+        return registered
+
+    def covers(self, fields: dict) -> bool:
+        """Whether the overlay fonts have a glyph for every character of the overlaid fields.
+
+        Characters a font lacks would be drawn as black boxes, so rows that
+        fail this check are compiled with xelatex instead.
+        """
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        for field, _, _, _, bold in self.positions:
+            text = fields.get(field, "")
+            font = pdfmetrics.getFont(self.fonts["bold" if bold else "regular"])
+            if isinstance(font, TTFont):
+                if any(ord(char) not in font.face.charToGlyph for char in text):
+                    return False
+            else:
+                try:
+                    text.encode(self.STANDARD_FONT_ENCODING)
+                except UnicodeEncodeError:
+                    return False
+        return True
+
+    def render(self, fields: dict, pdf_destination: str) -> str:
+        from pypdf import PdfReader, PdfWriter
+        from reportlab.pdfgen import canvas
+        overlay_buffer = io.BytesIO()
+        overlay = canvas.Canvas(overlay_buffer, pagesize=self.page_size)
+        for field, x, y, size, bold in self.positions:
+            overlay.setFont(self.fonts["bold" if bold else "regular"], size)
+            overlay.drawString(x, y, fields.get(field, ""))
+        if self.qr_url:
+            self._draw_qr_code(overlay, self.qr_url.format(id=fields.get("CERTIFICATE_ID", "")))
+        overlay.save()
+        writer = PdfWriter()
+        page = writer.add_page(PdfReader(io.BytesIO(self.base_bytes)).pages[0])
+        page.merge_page(PdfReader(overlay_buffer).pages[0])
+        with open(pdf_destination + ".tmp", 'wb') as f:
+            writer.write(f)
+        os.replace(pdf_destination + ".tmp", pdf_destination)
+        return pdf_destination
+
+    def _draw_qr_code(self, overlay, url: str):
+        from reportlab.graphics import renderPDF
+        from reportlab.graphics.barcode.qr import QrCodeWidget
+        from reportlab.graphics.shapes import Drawing
+        # Level M without a quiet zone, like the LaTeX qrcode package
+        widget = QrCodeWidget(url, barLevel="M", barBorder=0)
+        x0, y0, x1, y1 = widget.getBounds()
+        drawing = Drawing(self.QR_SIZE, self.QR_SIZE,
+                          transform=[self.QR_SIZE / (x1 - x0), 0, 0, self.QR_SIZE / (y1 - y0), 0, 0])
+        drawing.add(widget)
+        renderPDF.draw(drawing, overlay, self.page_size[0] - self.QR_MARGINS[0], self.QR_MARGINS[1])
+
+
+class CompileError(Exception):
+    """A certificate did not compile; the message is the first error from its .log, if there is one."""
+
+
+class _RosterReader:
+    """Re-iterable view of a roster file; see CertificateGenerator._read_participants."""
+    def __init__(self, generator, csv_file: str, *columns):
+        self.generator = generator
+        self.csv_file = csv_file
+        self.columns = columns
+
+    def __iter__(self):
+        return self.generator.participants_from_rows(
+            self.generator._iter_rows(self.csv_file, skipinitialspace=True), *self.columns
+        )
+
+
 class CertificateGenerator:
-    def __init__(self, template_file: str = "certificate_template.tex"):
+    def __init__(self, template_file: str = "certificate_template.tex", xelatex: str = "xelatex",
+                 compile_timeout: float = 30.0, memory_limit: int = None, compile_retries: int = 1):
+        # The TeX engine command; benchmarks point this at a stub so they run without TeX
+        self.xelatex = xelatex
+        # Watchdog for every xelatex run (see _run_supervised): seconds before it is killed, address
+        # space limit in MB, and how often a killed run is tried again
+        self.compile_timeout = compile_timeout
+        self.memory_limit = memory_limit
+        self.compile_retries = compile_retries
         with open(template_file, 'r', encoding='utf-8') as f:
             self.template = f.read()
+        # Parse the template once; every certificate is rendered from these segments
+        self.compiled_template = CompiledTemplate(self.template)
+        self.compiled_body = self.compiled_template.body()
+        # Formats dumped by this generator, by name; reused from any tex_dir since xelatex
+        # is pointed at their directory. The lock serialises dumps when batches run concurrently
+        self._preamble_formats = {}
+        self._format_lock = threading.Lock()
+        # Code points of the main font, looked up on the first validation (see _font_characters); the
+        # lock makes concurrent validations (events sharing this generator) wait for that lookup
+        self._main_font_characters = None
+        self._main_font_checked = False
+        self._font_lock = threading.Lock()
+
+    # Files the template pulls in at compile time; a change to any of them invalidates every PDF
+    ASSET_FILES = ["certificate_base_page.png"]
+    BUILD_MANIFEST = ".build_manifest.json"
+    # The only fields that differ between the certificates of one batch; the overlay
+    # backend typesets everything else once
+    OVERLAY_FIELDS = ("NAME", "DATE", "CERTIFICATE_ID")
+
+    # Characters with a special meaning in TeX, and how to typeset them literally
+    LATEX_SPECIALS = {
+        "\\": r"\textbackslash{}", "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#", "_": r"\_",
+        "{": r"\{", "}": r"\}", "~": r"\textasciitilde{}", "^": r"\textasciicircum{}",
+    }
+    LATEX_SPECIALS_PATTERN = re.compile(r"[\\&%$#_{}~^]")
+    # Completion date formats accepted in rosters; dates are normalized to the first one
+    DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%Y", "%d %B %Y", "%B %d, %Y")
+    MAIN_FONT_PATTERN = re.compile(r"^[^%\n]*\\setmainfont(?:\[[^\]]*\])?\{([^}]*)\}", re.MULTILINE)
+
+    # First error of a TeX log: "! message" or, with -file-line-error, "./file.tex:12: message"
+    LOG_ERROR_PATTERN = re.compile(r"^(?:! |\S+\.(?:tex|sty|cls|ltx):\d+: )(?P<message>.+)$")
+    # Stop at the first error instead of ploughing on (and never wait for terminal input)
+    XELATEX_OPTIONS = ["-interaction=nonstopmode", "-halt-on-error", "-file-line-error"]
+
+    # XeTeX cannot dump native (OpenType) fonts into a format, so the precompiled
+    # preamble stops right before the first font selection command.
+    FONT_SETUP_PATTERN = re.compile(r"^.*\\(setmainfont|setsansfont|setmonofont|newfontfamily|fontspec)\b", re.MULTILINE)
 
     def fill_template(self, fields: dict) -> str:
-        latex = self.template
-        for key, value in fields.items():
-            latex = latex.replace(f"{{{{{key}}}}}", value)
-        return latex
+        return self.compiled_template.render(fields)
+
+    @classmethod
+    def _escape_latex(cls, text: str) -> str:
+        """Escape TeX special characters so roster values are typeset as they are."""
+        return cls.LATEX_SPECIALS_PATTERN.sub(lambda match: cls.LATEX_SPECIALS[match.group()], text)
+
+    @classmethod
+    def _normalize_date(cls, value: str):
+        """Return value as YYYY-MM-DD if it matches one of DATE_FORMATS, else None."""
+        value = value.strip()
+        for date_format in cls.DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(value, date_format).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        return None
+
+    @classmethod
+    def _completion_date(cls, value: str) -> str:
+        """The completion date a certificate shows and its ID is derived from: value as YYYY-MM-DD, else today."""
+        return cls._normalize_date(value or "") or datetime.date.today().strftime("%Y-%m-%d")
+
+    @staticmethod
+    def certificate_id(course: str, name: str, completion_date: str) -> str:
+        """Return the certificate ID for a participant of a course, like "K7QX-M2PA-9TDE".
+
+        The ID is derived from the course (workshop title and dates), the name
+        and the completion date, so rebuilding a certificate gives it the same
+        ID again. 60 bits of a SHA-256 hash, in base32.
+        """
+        digest = hashlib.sha256("\0".join([course, name, completion_date]).encode('utf-8')).digest()
+        code = base64.b32encode(digest[:10]).decode('ascii')[:12]
+        return "-".join(code[i:i + 4] for i in range(0, 12, 4))
+
+    @staticmethod
+    def _qr_code(qr_url: str, certificate_id: str) -> str:
+        """LaTeX for a QR code of qr_url (with {id} filled in) in the bottom right corner, if qrcode is loaded."""
+        url = re.sub(r"([#%&_$])", r"\\\1", qr_url.format(id=certificate_id))
+        return (r"\ifdefined\qrcode\AddToShipoutPictureFG*{\put(\LenToUnit{\dimexpr\paperwidth-3.5cm\relax},\LenToUnit{1.5cm})"
+                r"{\qrcode[height=2cm]{%s}}}\fi" % url)
+
+    @staticmethod
+    def _contents_items(contents: list) -> str:
+        return "\n        ".join([f"\\item {item}" for item in contents])
 
     def generate_certificates_from_list(self, names: list, output_file: str = "certificates.tex",
                                         workshop_title: str = "Workshop Title",
@@ -29,6 +711,12 @@ class CertificateGenerator:
                                         signatory1: str = "Instructor",
                                         signatory2: str = "Chair",
                                         location: str = "Location") -> str:
+        """Write one combined document with a certificate for every entry of names.
+
+        An entry is a name, or a (name, completion_date) tuple; the certificate
+        then shows that completion date and carries the same ID as the
+        individual PDF of the row (see _completion_date). Plain names get date.
+        """
         if contents is None:
             contents = [
                 "Content_item 1",
@@ -42,7 +730,7 @@ class CertificateGenerator:
             date_range = date
         
         # Create a proper combined LaTeX document
-        combined_content = []
+        combined_content = _CombinedWriter(output_file)
         combined_content.append(r"""% Combined Certificates Template for BPCN
 \documentclass[12pt,a4paper]{article}
 \usepackage[utf8]{inputenc}
@@ -81,50 +769,42 @@ class CertificateGenerator:
 \begin{document}
 """)
         
-        for name in names:
-            fields = {
-                "NAME": name,
+        if self.compiled_body is not None:
+            # Everything except the name is the same on every certificate, so fill it in once
+            body_template = self.compiled_body.partial({
                 "SUBTITLE": "",
                 "WORKSHOP": workshop_title,
-                "DATE": date,
                 "DATE_RANGE": date_range,
                 "TUTORS": tutors,
                 "DURATION": duration,
-                "CONTENTS": "\n        ".join([f"\\item {item}" for item in contents]),
+                "CONTENTS": self._contents_items(contents),
                 "SIGNATORY1": signatory1,
                 "SIGNATORY2": signatory2,
-            }
-            
-            # Get the template content and extract just the document body
-            template_content = self.fill_template(fields)
-            
-            # Extract the content between \begin{document} and \end{document}
-            start_marker = r"\begin{document}"
-            end_marker = r"\end{document}"
-            start_pos = template_content.find(start_marker)
-            end_pos = template_content.find(end_marker)
-            
-            if start_pos != -1 and end_pos != -1:
-                # Extract the document body (content between \begin{document} and \end{document})
-                document_body = template_content[start_pos + len(start_marker):end_pos].strip()
-                combined_content.append(document_body)
+            })
+            course = f"{workshop_title} {date_range}"
+            for entry in names:
+                if isinstance(entry, tuple):
+                    name, person_date = entry[0], self._completion_date(entry[1])
+                else:
+                    name, person_date = entry, date
+                combined_content.append(body_template.render({
+                    "NAME": self._escape_latex(name),
+                    "DATE": person_date,
+                    "CERTIFICATE_ID": self.certificate_id(course, name, person_date),
+                    "CERTIFICATE_QR": "",
+                }))
                 # Add a page break between certificates
                 combined_content.append(r"\newpage")
         
         # Close the document
         combined_content.append(r"\end{document}")
-        
-        # Write the combined document
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("\n\n".join(combined_content))
+        combined_content.close()
         return output_file
 
-    def generate_certificates_from_csv(self, csv_file: str, output_file: str = "certificates.tex", **kwargs) -> str:
-        import csv
-        names = []
-        with open(csv_file, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
+    def generate_certificates_from_csv(self, csv_file: str, output_file: str = "certificates.tex",
+                                       completion_date_column: str = "completion_date", **kwargs) -> str:
+        def iter_names():
+            for row in self._iter_rows(csv_file):
                 # Combine Lastname and Name columns if present, with proper whitespace handling
                 if 'Lastname' in row and 'Name' in row:
                     lastname = row['Lastname'].strip()
@@ -136,49 +816,161 @@ class CertificateGenerator:
                     full_name = f"{lastname} {firstname}".strip()
                 else:
                     full_name = row.get('Name', '').strip()
-                names.append(full_name)
-        return self.generate_certificates_from_list(names, output_file=output_file, **kwargs)
+                # With the completion date, so the certificate IDs match those of the individual PDFs
+                yield full_name, (row.get(completion_date_column) or '').strip()
+        # Names are read lazily while the combined document is being written
+        return self.generate_certificates_from_list(iter_names(), output_file=output_file, **kwargs)
+
+    @staticmethod
+    def _iter_rows(input_file: str, skipinitialspace: bool = False):
+        """Yield the rows of a CSV or JSON-lines (.jsonl/.ndjson) roster one at a time as dicts of strings."""
+        import csv
+        if input_file.endswith(('.jsonl', '.ndjson')):
+            with open(input_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        yield {key: "" if value is None else str(value) for key, value in row.items()}
+            return
+        with open(input_file, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f, skipinitialspace=skipinitialspace)
+
+    def _read_participants(self, csv_file: str, lastname_column: str = "Lastname", name_column: str = "Name",
+                           completion_date_column: str = "completion_date"):
+        """Return the roster's (full_name, completion_date) rows as an iterable.
+
+        Every iteration reads the file again, one row at a time, so the rows are
+        never all held in memory and a second pass (e.g. the single-compile
+        fallback) sees them again.
+        """
+        return _RosterReader(self, csv_file, lastname_column, name_column, completion_date_column)
+
+    @staticmethod
+    def participants_from_rows(rows, lastname_column: str = "Lastname", name_column: str = "Name",
+                               completion_date_column: str = "completion_date"):
+        """Yield (full_name, completion_date) for roster rows given as dicts of strings.
+
+        completion_date is the column's text as it is ("" if the row has none);
+        generate_individual_certificates normalizes it (see _normalize_date),
+        so validation can still reject dates it cannot read.
+        """
+        for row in rows:
+            lastname = (row.get(lastname_column) or '').strip()
+            firstname = (row.get(name_column) or '').strip()
+            # Handle case where column name has a space
+            if not firstname and ' Name' in row:
+                firstname = row[' Name'].strip()
+            full_name = f"{lastname} {firstname}".strip()
+            completion_date = (row.get(completion_date_column) or '').strip() if completion_date_column else ''
+            yield full_name, completion_date
 
     def generate_individual_certificates_from_csv(self, csv_file: str,
                                                 lastname_column: str = "Lastname",
                                                 name_column: str = "Name",
                                                 completion_date_column: str = "completion_date",
-                                                output_dir: str = "output/pdfs",
-                                                workshop_title: str = "Workshop_Title",
-                                                tutors: str = "Instructor",
-                                                duration: str = "Duration_hours",
-                                                contents: list = None,
-                                                date: str = None,
-                                                date_range: str = None,
-                                                signatory1: str = "Instructor",
-                                                signatory2: str = "Chair",
-                                                location: str = "Jena") -> list:
-        import csv
-        import subprocess
-        import shutil
+                                                **kwargs) -> list:
+        """Compile one PDF per roster row; see generate_individual_certificates for the options.
+
+        The roster is a CSV file or a JSON-lines file (.jsonl/.ndjson) with the
+        same keys. It is read lazily, so rows start compiling while the rest of
+        the file is still unread.
+        """
+        participants = self._read_participants(csv_file, lastname_column, name_column, completion_date_column)
+        return self.generate_individual_certificates(participants, **kwargs)
+
+    def generate_individual_certificates(self, participants,
+                                         output_dir: str = "output/pdfs",
+                                         workshop_title: str = "Workshop_Title",
+                                         tutors: str = "Instructor",
+                                         duration: str = "Duration_hours",
+                                         contents: list = None,
+                                         date: str = None,
+                                         date_range: str = None,
+                                         signatory1: str = "Instructor",
+                                         signatory2: str = "Chair",
+                                         location: str = "Jena",
+                                         workers: int = None,
+                                         precompile_preamble: bool = False,
+                                         single_compile: bool = False,
+                                         incremental: bool = False,
+                                         tex_dir: str = "output/tex",
+                                         on_result=None,
+                                         instrumentation: BuildInstrumentation = None,
+                                         scratch_dir: str = None,
+                                         backend: str = "xelatex",
+                                         overlay_fonts: dict = None,
+                                         validate: bool = False,
+                                         executor: concurrent.futures.Executor = None,
+                                         signer: CertificateSigner = None,
+                                         archive: str = None,
+                                         archive_size: int = None,
+                                         certificate_index: "CertificateIndex" = None,
+                                         qr_url: str = None) -> list:
+        """Compile one PDF per participant into output_dir.
+
+        participants is an iterable of (full_name, completion_date) tuples, such
+        as participants_from_rows() produces. It is rendered and compiled as a
+        stream, so memory use does not grow with the number of rows. (The
+        single-compile mode may need a second pass; a one-shot iterator is then
+        turned into a list first.)
+
+        Compiles run on a pool of `workers` threads (defaults to the CPU count).
+        With precompile_preamble=True the template preamble is dumped once into
+        a cached XeLaTeX format (see _ensure_preamble_format) that every compile
+        loads instead of re-reading the packages.
+        With single_compile=True all rows are typeset in one xelatex run and the
+        resulting PDF is split page by page into the per-row files (see
+        _compile_combined_and_split).
+        With incremental=True a build manifest in output_dir records the hashes
+        each PDF was built from; rows whose PDF is still up to date are skipped
+        and PDFs of rows removed from the CSV are deleted.
+        on_result(index, name, pdf_path, error) is called for every row as soon
+        as its PDF is ready (pdf_path is None if it failed). It may run on a
+        worker thread, before the next row with the same file name is compiled.
+        instrumentation (a BuildInstrumentation) receives per-row stage timings
+        and row results; its start() and finish() are called by this method.
+        With scratch_dir (e.g. a tmpfs such as /dev/shm/certificates) every
+        worker thread compiles in its own directory below it, under a job name
+        made unique with the row index, and only the finished PDF is written to
+        output_dir (atomically). The .tex and .log of failed rows are copied to
+        tex_dir for inspection; everything else is removed after the run.
+        backend="overlay" typesets the page once without name and date and
+        then stamps those onto it per row in pure Python (see
+        _prepare_overlay), which needs pypdf and reportlab. overlay_fonts maps
+        "regular"/"bold" to TrueType files for that; the default is Helvetica,
+        which has Arial's metrics but only covers Latin-1. Rows with
+        characters the overlay fonts lack are compiled with xelatex.
+        With validate=True the whole roster is checked before the first compile
+        (see _validate_participants); rows that would fail are reported as
+        rejected and not compiled, and rows that would overwrite another row's
+        PDF get a -<row> suffix and a warning. Names are always escaped for
+        TeX.
+        executor (e.g. the pool of generate_from_manifest) runs the compiles
+        instead of a pool of this call's own; workers then only sets how many
+        rows are queued on it at a time.
+        With a signer (a CertificateSigner) every PDF is signed right after it
+        is compiled, on the same worker thread, so signing overlaps with the
+        compiles of other rows. A PDF that cannot be signed is deleted and its
+        row reported as failed.
+        With archive (e.g. "output/certificates.zip", or .tar/.tar.gz) every
+        PDF is moved into the archive as soon as it is ready, in CSV order, and
+        not kept in output_dir; archive_size starts a new archive every that
+        many PDFs (see _ArchiveWriter). Since no PDFs stay behind, incremental
+        builds then compile every row again.
+        Every certificate gets an ID (see certificate_id) for the template's
+        {{CERTIFICATE_ID}} placeholder. With qr_url (e.g.
+        "https://example.org/verify/{id}") {{CERTIFICATE_QR}} becomes a QR code
+        of that URL, if the LaTeX qrcode package is installed; the overlay
+        backend then draws the same QR code with reportlab. With a certificate_index (a CertificateIndex)
+        every issued certificate is recorded there, without a PDF path if
+        on_result moved the PDF away.
+        Every xelatex run is killed after compile_timeout seconds (see
+        _run_supervised). Rows that fail or are rejected are listed, with
+        their first TeX error and .log, in tex_dir/compile_failures.csv.
+        Returns the paths of the generated PDFs in CSV order; rows that fail
+        are reported and left out. With archive, returns the archive paths.
+        """
         os.makedirs(output_dir, exist_ok=True)
-        names = []
-        completion_dates = []
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, skipinitialspace=True)
-            for row in reader:
-                lastname = row.get(lastname_column, '').strip()
-                firstname = row.get(name_column, '').strip()
-                # Handle case where column name has a space
-                if not firstname and ' Name' in row:
-                    firstname = row[' Name'].strip()
-                full_name = f"{lastname} {firstname}".strip()
-                names.append(full_name)
-                if completion_date_column and completion_date_column in row and row[completion_date_column].strip():
-                    try:
-                        date_obj = datetime.datetime.strptime(
-                            row[completion_date_column].strip(), "%Y-%m-%d"
-                        ).date()
-                        completion_dates.append(date_obj.strftime("%Y-%m-%d"))
-                    except ValueError:
-                        completion_dates.append(datetime.date.today().strftime("%Y-%m-%d"))
-                else:
-                    completion_dates.append(datetime.date.today().strftime("%Y-%m-%d"))
         if contents is None:
             contents = [
                 "Very interesting content 1",
@@ -190,62 +982,1031 @@ class CertificateGenerator:
             date = datetime.date.today().strftime("%Y-%m-%d")
         if date_range is None:
             date_range = date
-        generated_pdfs = []
-        for i, (name, person_date) in enumerate(zip(names, completion_dates), 1):
-            fields = {
-                "NAME": name,
-                "SUBTITLE": "",
-                "WORKSHOP": workshop_title,
-                "DATE": person_date,
-                "DATE_RANGE": date_range,
-                "TUTORS": tutors,
-                "DURATION": duration,
-                "CONTENTS": "\n        ".join([f"\\item {item}" for item in contents]),
-                "SIGNATORY1": signatory1,
-                "SIGNATORY2": signatory2,
-            }
-            latex_content = self.fill_template(fields)
-            # Ensure each individual certificate is a complete LaTeX document
-            # (No need to add \documentclass, \begin{document}, or \end{document} since the template already includes them)
-            safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            safe_name = safe_name.replace(' ', '_')
-            
-            # Create tex directory if it doesn't exist
-            tex_dir = "output/tex"
-            os.makedirs(tex_dir, exist_ok=True)
-            
-            latex_filename = os.path.join(tex_dir, f"certificate_{safe_name}.tex")
-            pdf_filename = f"certificate_{safe_name}.pdf"
-            with open(latex_filename, 'w', encoding='utf-8') as f:
-                f.write(latex_content)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if (single_compile or validate) and iter(participants) is participants:
+            participants = list(participants)
+        # Create tex directory if it doesn't exist
+        os.makedirs(tex_dir, exist_ok=True)
+        fmt_name = self._ensure_preamble_format(tex_dir) if precompile_preamble else None
+        # Only the name and completion date change per row, so fill in the rest once
+        row_template = self.compiled_template.partial({
+            "SUBTITLE": "",
+            "WORKSHOP": workshop_title,
+            "DATE_RANGE": date_range,
+            "TUTORS": tutors,
+            "DURATION": duration,
+            "CONTENTS": self._contents_items(contents),
+            "SIGNATORY1": signatory1,
+            "SIGNATORY2": signatory2,
+        })
+        # Identifies the course in certificate IDs and the certificate index
+        course = f"{workshop_title} {date_range}"
+        overlay = None
+        if backend == "overlay":
+            overlay = self._prepare_overlay(row_template, tex_dir, fmt_name=fmt_name, fonts=overlay_fonts,
+                                            qr_url=qr_url)
+        elif backend != "xelatex":
+            raise ValueError(f"Unknown backend '{backend}', expected 'xelatex' or 'overlay'")
+        if incremental:
+            template_hash = hashlib.sha256(self.template.encode('utf-8')).hexdigest()
+            assets_hash = self._assets_hash()
+            # Up-to-date checks use the manifest as it was at the start of the run
+            previous_manifest = self._load_build_manifest(output_dir)
+            manifest = {}
+
+        if instrumentation is not None:
+            instrumentation.start()
+
+        # Row index -> reason, for rows that are reported up front and never compiled
+        rejected = {}
+        # Row index -> (name, first row) for rows whose file name an earlier row has; they get a -<row> suffix
+        duplicates = {}
+        if validate:
+            started = time.perf_counter()
+            rejected, duplicates = self._validate_participants(participants)
+            for index, (name, first_row) in sorted(duplicates.items()):
+                print(f"Warning: row {index + 1} ({name}) has the same output file name as row {first_row + 1}, "
+                      f"writing it as certificate_{self._safe_name(name)}-{index + 1}.pdf")
+            for index, (name, reason) in sorted(rejected.items()):
+                print(f"Rejected row {index + 1} ({name}): {reason}")
+                if on_result is not None:
+                    on_result(index, name, None, ValueError(reason))
+                if instrumentation is not None:
+                    instrumentation.row_done(index, name, "rejected", error=reason)
+            print(f"Validated roster in {time.perf_counter() - started:.2f} s, {len(rejected)} row(s) rejected")
+
+        def timed_participants():
+            """Iterate the participants, timing how long each row takes to read."""
+            participant_iter = iter(participants)
+            index = 0
+            while True:
+                started = time.perf_counter()
+                try:
+                    participant = next(participant_iter)
+                except StopIteration:
+                    return
+                instrumentation.record(index, "parse", time.perf_counter() - started)
+                yield participant
+                index += 1
+
+        def overlay_for(fields):
+            """The overlay to stamp a row with, or None to compile it with xelatex."""
+            return overlay if overlay is not None and overlay.covers(fields) else None
+
+        def iter_jobs():
+            """Render the participants lazily, yielding (name, job_name, latex_content, hashes, index, fields)."""
+            rows = participants if instrumentation is None else timed_participants()
+            for index, (name, person_date) in enumerate(rows):
+                if index in rejected:
+                    continue
+                started = time.perf_counter()
+                # Rows without a date, or (with validation off) with one that cannot be read, get today's
+                person_date = self._completion_date(person_date)
+                certificate_id = self.certificate_id(course, name, person_date)
+                fields = {"NAME": name, "DATE": person_date, "CERTIFICATE_ID": certificate_id}
+                row_overlay = overlay_for(fields)
+                if overlay is not None and row_overlay is None:
+                    print(f"Overlay font lacks characters of {name}, compiling with xelatex.")
+                latex_content = row_template.render({
+                    "NAME": self._escape_latex(name),
+                    "DATE": person_date,
+                    "CERTIFICATE_ID": certificate_id,
+                    "CERTIFICATE_QR": self._qr_code(qr_url, certificate_id) if qr_url else "",
+                })
+                # Ensure each individual certificate is a complete LaTeX document
+                # (No need to add \documentclass, \begin{document}, or \end{document} since the template already includes them)
+                hashes = None
+                if incremental:
+                    hashes = {
+                        "latex": hashlib.sha256(latex_content.encode('utf-8')).hexdigest(),
+                        "template": template_hash,
+                        "assets": assets_hash,
+                    }
+                    if row_overlay is not None:
+                        hashes["backend"] = "overlay"
+                    if signer is not None:
+                        hashes["signer"] = signer.fingerprint
+                if fmt_name:
+                    latex_content = self._mark_end_of_dump(latex_content)
+                safe_name = self._safe_name(name)
+                if index in duplicates:
+                    safe_name = f"{safe_name}-{index + 1}"
+                if instrumentation is not None:
+                    instrumentation.record(index, "render", time.perf_counter() - started)
+                yield name, f"certificate_{safe_name}", latex_content, hashes, index, fields
+
+        def is_up_to_date(job):
+            _, job_name, _, hashes, _, _ = job
+            return (incremental and previous_manifest.get(f"{job_name}.pdf") == hashes
+                    and os.path.exists(os.path.join(output_dir, f"{job_name}.pdf")))
+
+        # xelatex output of failed rows, by row index, until the row is reported
+        failure_output = {}
+
+        scratch_root = None
+        if scratch_dir:
+            os.makedirs(scratch_dir, exist_ok=True)
+            scratch_root = tempfile.mkdtemp(prefix="run-", dir=scratch_dir)
+            self._link_assets(scratch_root)
+            scratch_state = threading.local()
+            scratch_numbers = itertools.count()
+
+        def worker_scratch_dir():
+            # Two levels below scratch_root, so the template's ../../ asset paths resolve to the links there
+            if not hasattr(scratch_state, "path"):
+                scratch_state.path = os.path.join(scratch_root, "workers", f"worker-{next(scratch_numbers)}")
+                os.makedirs(scratch_state.path)
+            return scratch_state.path
+
+        def compile_job(job):
+            name, job_name, latex_content, _, index, fields = job
+            stats = {} if instrumentation is not None else None
+            row_overlay = overlay_for(fields)
+            if row_overlay is not None:
+                result = self._render_overlay(row_overlay, fields, job_name, output_dir, stats=stats)
+            elif scratch_root is None:
+                result = self._compile_certificate(latex_content, job_name, tex_dir, output_dir,
+                                                   fmt_name=fmt_name, stats=stats)
+            else:
+                result = self._compile_in_scratch(latex_content, job_name, index, worker_scratch_dir(),
+                                                  tex_dir, output_dir, fmt_name=fmt_name, stats=stats)
+            if signer is not None:
+                result = self._sign_certificate(signer, result, stats=stats)
+            if stats:
+                for stage, seconds in stats.get("stages", {}).items():
+                    instrumentation.record(index, stage, seconds)
+                if "output" in stats:
+                    failure_output[index] = stats["output"]
+            if on_result is not None:
+                on_result(index, name, *result)
+            return result
+
+        def iter_outcomes():
+            """Yield (name, job_name, hashes, index, fields, result) in roster order; result is None for up-to-date rows."""
+            if single_compile and overlay is None:
+                # The combined document is written as rows are rendered; only the small
+                # per-row bookkeeping is kept until the split
+                rows = []
+
+                def pending_jobs():
+                    for job in iter_jobs():
+                        up_to_date = is_up_to_date(job)
+                        rows.append((job[0], job[1], job[3], job[4], job[5], up_to_date))
+                        if not up_to_date:
+                            yield job[:3]
+
+                split_results = self._compile_combined_and_split(pending_jobs(),
+                                                                 worker_scratch_dir() if scratch_root else tex_dir,
+                                                                 output_dir, fmt_name=fmt_name,
+                                                                 instrumentation=instrumentation)
+                if split_results is not None:
+                    split_results = iter(split_results)
+                    split_outcomes = ((name, job_name, hashes, index, fields,
+                                       None if up_to_date else next(split_results))
+                                      for name, job_name, hashes, index, fields, up_to_date in rows)
+
+                    def finish_split(outcome):
+                        # Signing is the per-row work left after the split, so it runs on the pool like compiles
+                        name, _, _, index, _, result = outcome
+                        if signer is not None:
+                            stats = {} if instrumentation is not None else None
+                            result = self._sign_certificate(signer, result, stats=stats)
+                            if stats:
+                                instrumentation.record(index, "sign", stats["stages"]["sign"])
+                        if on_result is not None:
+                            on_result(index, name, *result)
+                        return result
+
+                    for outcome, result in self._compile_in_order(split_outcomes, finish_split, workers,
+                                                                  skip=lambda outcome: outcome[5] is None,
+                                                                  executor=executor):
+                        yield outcome[0], outcome[1], outcome[2], outcome[3], outcome[4], result
+                    return
+            for job, result in self._compile_in_order(iter_jobs(), compile_job, workers, skip=is_up_to_date,
+                                                           executor=executor):
+                yield job[0], job[1], job[3], job[4], job[5], result
+
+        def iter_outcomes_and_clean_up():
             try:
-                result = subprocess.run(
-                    ["xelatex", "-interaction=nonstopmode", f"certificate_{safe_name}.tex"],
-                    capture_output=True,
-                    text=True,
-                    cwd=tex_dir
-                )
-                if result.returncode == 0 and os.path.exists(os.path.join(tex_dir, pdf_filename)):
-                    pdf_source = os.path.join(tex_dir, pdf_filename)
-                    pdf_destination = os.path.join(output_dir, pdf_filename)
-                    shutil.move(pdf_source, pdf_destination)
+                yield from iter_outcomes()
+            finally:
+                # Runs when the loop below finishes or is abandoned by an exception
+                if scratch_root is not None:
+                    shutil.rmtree(scratch_root, ignore_errors=True)
+
+        generated_pdfs = []
+        seen_outputs = set()
+        # (row index, name, error, log file) of every row without a PDF, for compile_failures.csv
+        failures = [(index, name, reason, "") for index, (name, reason) in sorted(rejected.items())]
+        archive_writer = _ArchiveWriter(archive, archive_size) if archive else None
+        def hand_off(index, name, fields, pdf_path):
+            """Pass a finished PDF on to the archive and the certificate index."""
+            location = pdf_path
+            if archive_writer is not None:
+                location = archive_writer.add(index, name, pdf_path)
+            elif not os.path.exists(pdf_path):
+                # on_result took the PDF away (the rendering service keeps it only for a while)
+                location = None
+            if certificate_index is not None:
+                certificate_index.record(fields["CERTIFICATE_ID"], name, workshop_title, date_range,
+                                         fields["DATE"], location)
+
+        try:
+            for name, job_name, hashes, index, fields, result in iter_outcomes_and_clean_up():
+                seen_outputs.add(f"{job_name}.pdf")
+                if result is None:
+                    pdf_destination = os.path.join(output_dir, f"{job_name}.pdf")
                     generated_pdfs.append(pdf_destination)
-                    for ext in ['.aux', '.log', '.out']:
-                        aux_file = os.path.join(tex_dir, f"certificate_{safe_name}{ext}")
-                        if os.path.exists(aux_file):
-                            os.remove(aux_file)
+                    manifest[f"{job_name}.pdf"] = hashes
+                    if on_result is not None:
+                        on_result(index, name, pdf_destination, None)
+                    if instrumentation is not None:
+                        instrumentation.row_done(index, name, "up_to_date", pdf=pdf_destination)
+                    print(f"Up to date: {pdf_destination}")
+                    hand_off(index, name, fields, pdf_destination)
+                    continue
+                pdf_destination, error = result
+                if pdf_destination:
+                    generated_pdfs.append(pdf_destination)
+                    if incremental:
+                        manifest[f"{job_name}.pdf"] = hashes
                     print(f"Generated: {pdf_destination}")
+                    hand_off(index, name, fields, pdf_destination)
                 else:
-                    print(f"Failed to generate PDF for {name}")
-            except Exception as e:
-                print(f"Error generating PDF for {name}: {e}")
-            # Keep LaTeX files in tex directory for reference
+                    if incremental:
+                        manifest.pop(f"{job_name}.pdf", None)
+                    if error:
+                        print(f"Error generating PDF for {name}: {error}")
+                    else:
+                        print(f"Failed to generate PDF for {name}")
+                    failures.append((index, name, str(error) if error else "", f"{job_name}.log"))
+                if instrumentation is not None:
+                    instrumentation.row_done(index, name, "generated" if pdf_destination else "failed",
+                                             pdf=pdf_destination, error=str(error) if error else None,
+                                             output=failure_output.pop(index, None))
+        except BaseException:
+            # An archive only gets its final name once it is complete
+            if archive_writer is not None:
+                partial = archive_writer.abort()
+                if partial:
+                    print(f"Run aborted, the unfinished archive is left as {partial}")
+            raise
+        finally:
+            if certificate_index is not None:
+                certificate_index.flush()
+        if archive_writer is not None:
+            archived = len(generated_pdfs)
+            generated_pdfs = archive_writer.close()
+            print(f"Archived {archived} certificates in: {', '.join(generated_pdfs)}")
+        self._write_failure_report(tex_dir, failures)
+        # Keep LaTeX files in tex directory for reference
+        if incremental:
+            # Outputs of rows that are no longer in the CSV
+            for pdf_filename in set(previous_manifest) - seen_outputs:
+                pdf_path = os.path.join(output_dir, pdf_filename)
+                if os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+                    print(f"Removed: {pdf_path}")
+            self._save_build_manifest(output_dir, manifest)
+        if instrumentation is not None:
+            instrumentation.finish()
         return generated_pdfs
 
+    FAILURE_REPORT = "compile_failures.csv"
+
+    @classmethod
+    def _write_failure_report(cls, tex_dir: str, failures: list):
+        """Write the rows without a PDF to tex_dir/compile_failures.csv and print them grouped by error.
+
+        A report left over from an earlier run is removed when nothing failed.
+        """
+        import csv
+        report_path = os.path.join(tex_dir, cls.FAILURE_REPORT)
+        if not failures:
+            if os.path.exists(report_path):
+                os.remove(report_path)
+            return
+        os.makedirs(tex_dir, exist_ok=True)
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["row", "name", "error", "log"])
+            for index, name, error, log_file in sorted(failures):
+                writer.writerow([index + 1, name, error, os.path.join(tex_dir, log_file) if log_file else ""])
+        # Rows usually fail for a handful of reasons; show each once with the rows it hit
+        by_error = collections.defaultdict(list)
+        for index, _, error, _ in failures:
+            by_error[error.splitlines()[0] if error else "unknown error"].append(index + 1)
+        print(f"{len(failures)} row(s) without a PDF, see {report_path}:")
+        for error, rows in sorted(by_error.items(), key=lambda item: -len(item[1])):
+            shown = ", ".join(str(row) for row in sorted(rows)[:10])
+            more = f" and {len(rows) - 10} more" if len(rows) > 10 else ""
+            print(f"  {len(rows)} x {error} (rows {shown}{more})")
+
+    @staticmethod
+    def _sign_certificate(signer: CertificateSigner, result: tuple, stats: dict = None) -> tuple:
+        """Sign the PDF of a compile result (pdf_path, error); returns the result to report."""
+        pdf_path, error = result
+        if not pdf_path:
+            return result
+        started = time.perf_counter()
+        try:
+            signer.sign(pdf_path)
+        except Exception as e:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            return None, RuntimeError(f"signing failed: {e}")
+        if stats is not None:
+            stats.setdefault("stages", {})["sign"] = time.perf_counter() - started
+        return result
+
+    @staticmethod
+    def _safe_name(name: str) -> str:
+        """The part of a participant's output file name derived from the name."""
+        safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        return safe_name.replace(' ', '_')
+
+    def _validate_participants(self, participants) -> tuple:
+        """Check every (full_name, completion_date) row before anything is compiled.
+
+        Returns (rejected, duplicates). rejected is {row_index: (name, reason)}
+        for the rows to reject: empty names, names with characters the
+        template's main font cannot display (checked with fontTools if it is
+        installed, see _font_characters), and completion dates that match none
+        of DATE_FORMATS (rows without a date are kept and get today's date).
+        duplicates is {row_index: (name, first_row_index)} for rows whose
+        output file name an earlier row already has; they are compiled under
+        the name with a -<row> suffix.
+        """
+        font_characters = self._font_characters()
+        rejected = {}
+        duplicates = {}
+        first_rows = {}
+        for index, (name, person_date) in enumerate(participants):
+            safe_name = self._safe_name(name)
+            if not safe_name:
+                reason = "empty name" if not name.strip() else "name has no characters usable in a file name"
+            elif font_characters is not None and any(
+                    ord(c) not in font_characters for c in name if not c.isspace()):
+                missing = "".join(sorted({c for c in name if not c.isspace() and ord(c) not in font_characters}))
+                reason = f"characters not in the font: {missing}"
+            elif (person_date or "").strip() and self._normalize_date(person_date) is None:
+                reason = f"invalid completion date '{person_date}'"
+            elif safe_name in first_rows:
+                duplicates[index] = (name, first_rows[safe_name])
+                # A later name could map to the suffixed file name too
+                first_rows.setdefault(f"{safe_name}-{index + 1}", index)
+                continue
+            else:
+                first_rows[safe_name] = index
+                continue
+            rejected[index] = (name, reason)
+        return rejected, duplicates
+
+    def _font_characters(self):
+        """Return the set of code points the template's main font covers, or None if that cannot be checked.
+
+        The font named by \\setmainfont is located with fc-match and read with
+        fontTools; without either of them, or if fc-match only finds a substitute
+        for it, names are not checked against the font.
+        """
+        with self._font_lock:
+            if not self._main_font_checked:
+                self._main_font_characters = self._look_up_font_characters()
+                self._main_font_checked = True
+            return self._main_font_characters
+
+    def _look_up_font_characters(self):
+        """Read the main font's code points for _font_characters; None if they cannot be read."""
+        font_match = self.MAIN_FONT_PATTERN.search(self.template)
+        if font_match is None:
+            return None
+        try:
+            from fontTools.ttLib import TTFont
+        except ImportError:
+            print("fontTools is not installed (pip install fonttools), names are not checked against the font.")
+            return None
+        font_name = font_match.group(1)
+        try:
+            font_file, _, families = subprocess.run(["fc-match", "-f", "%{file}\n%{family}", font_name],
+                                                    capture_output=True, text=True, check=True).stdout.partition("\n")
+            # fc-match answers with a substitute (e.g. DejaVu Sans) when the font is not installed
+            if font_name.casefold() not in {family.strip().casefold() for family in families.split(",")}:
+                print(f"The font '{font_name}' is not installed (fc-match offers '{families.strip()}'), "
+                      "names are not checked against the font.")
+                return None
+            font = TTFont(font_file.strip(), fontNumber=0, lazy=True)
+            return set(font.getBestCmap())
+        except Exception as e:
+            print(f"Could not read the font '{font_name}' ({e}), names are not checked against the font.")
+            return None
+
+    @staticmethod
+    def _compile_in_order(jobs, compile_job, workers: int, skip=None, executor=None):
+        """Run compile_job over jobs on a thread pool, yielding (job, result) in input order.
+
+        Jobs are pulled from the iterable only as fast as the pool drains them (at
+        most 2 * workers are queued), so compiling starts with the first row and
+        memory does not grow with the roster. Jobs for which skip(job) is true are
+        passed through with a result of None. Jobs sharing a job_name (job[1])
+        write the same files, so such a job waits for the earlier one to finish.
+        With an executor the jobs run on that (shared) pool instead of a new one.
+        """
+        workers = max(1, workers)
+        window = collections.deque()
+        in_flight = {}
+
+        def pop_oldest():
+            job, future = window.popleft()
+            if future is None:
+                return job, None
+            if in_flight.get(job[1]) is future:
+                del in_flight[job[1]]
+            return job, future.result()
+
+        # xelatex does the heavy lifting in a subprocess, so threads are enough to keep every core busy
+        own_executor = executor is None
+        if own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        try:
+            for job in jobs:
+                while len(window) >= 2 * workers:
+                    yield pop_oldest()
+                if skip is not None and skip(job):
+                    window.append((job, None))
+                    continue
+                previous = in_flight.get(job[1])
+                if previous is not None:
+                    concurrent.futures.wait([previous])
+                future = executor.submit(compile_job, job)
+                in_flight[job[1]] = future
+                window.append((job, future))
+            while window:
+                yield pop_oldest()
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+    def _assets_hash(self) -> str:
+        """Hash the contents of ASSET_FILES (missing files hash as missing)."""
+        digest = hashlib.sha256()
+        for asset in self.ASSET_FILES:
+            digest.update(asset.encode('utf-8'))
+            if os.path.exists(asset):
+                with open(asset, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+            else:
+                digest.update(b"\0missing")
+        return digest.hexdigest()
+
+    def _load_build_manifest(self, output_dir: str) -> dict:
+        manifest_file = os.path.join(output_dir, self.BUILD_MANIFEST)
+        if not os.path.exists(manifest_file):
+            return {}
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"Ignoring unreadable build manifest {manifest_file}, rebuilding all certificates.")
+            return {}
+
+    def _save_build_manifest(self, output_dir: str, manifest: dict):
+        manifest_file = os.path.join(output_dir, self.BUILD_MANIFEST)
+        # Write to a temporary file first so an interrupted run never leaves a truncated manifest
+        with open(manifest_file + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+    def _dump_position(self):
+        """Return the offset in the template where the dumpable preamble ends, or None."""
+        begin_pos = self.template.find(r"\begin{document}")
+        if begin_pos == -1:
+            return None
+        font_match = self.FONT_SETUP_PATTERN.search(self.template, 0, begin_pos)
+        dump_pos = font_match.start() if font_match else begin_pos
+        # The format is shared by every certificate, so it must not contain placeholders
+        if "{{" in self.template[:dump_pos]:
+            return None
+        return dump_pos
+
+    def _mark_end_of_dump(self, latex_content: str) -> str:
+        """Insert mylatexformat's \\endofdump marker where the precompiled preamble ends."""
+        dump_pos = self._dump_position()
+        return latex_content[:dump_pos] + "\\endofdump\n" + latex_content[dump_pos:]
+
+    def _ensure_preamble_format(self, tex_dir: str):
+        """Dump the template preamble into a XeLaTeX format file in tex_dir.
+
+        The format is named after a hash of the preamble text, so editing the
+        template automatically leads to a new format being built. A format this
+        generator already dumped elsewhere is reused. Returns the
+        absolute path of the format without its .fmt extension, or None if the
+        preamble cannot be precompiled (in which case certificates are compiled
+        the normal way).
+        """
+        dump_pos = self._dump_position()
+        if dump_pos is None:
+            print("Template preamble cannot be precompiled, compiling certificates normally.")
+            return None
+        preamble = self.template[:dump_pos]
+        fmt_name = "certificate_preamble_" + hashlib.sha256(preamble.encode('utf-8')).hexdigest()[:16]
+        fmt_path = os.path.abspath(os.path.join(tex_dir, fmt_name))
+        with self._format_lock:
+            known_path = self._preamble_formats.get(fmt_name)
+            if known_path and os.path.exists(f"{known_path}.fmt"):
+                return known_path
+            if not os.path.exists(f"{fmt_path}.fmt"):
+                fmt_path = self._dump_preamble_format(tex_dir, fmt_name)
+            if fmt_path:
+                self._preamble_formats[fmt_name] = fmt_path
+            return fmt_path
+
+    def _dump_preamble_format(self, tex_dir: str, fmt_name: str):
+        """Run the xelatex -ini dump for _ensure_preamble_format."""
+        os.makedirs(tex_dir, exist_ok=True)
+        with open(os.path.join(tex_dir, f"{fmt_name}.tex"), 'w', encoding='utf-8') as f:
+            f.write(self._mark_end_of_dump(self.template))
+        try:
+            returncode, _, killed = self._run_supervised(
+                [self.xelatex, "-ini"] + self.XELATEX_OPTIONS + [f"-jobname={fmt_name}",
+                                                                 "&xelatex", "mylatexformat.ltx", f"{fmt_name}.tex"],
+                tex_dir
+            )
+        except FileNotFoundError:
+            print("XeLaTeX not found. Please install a LaTeX distribution (like TeX Live or MiKTeX).")
+            return None
+        if returncode != 0 or not os.path.exists(os.path.join(tex_dir, f"{fmt_name}.fmt")):
+            reason = killed or self._first_log_error(os.path.join(tex_dir, f"{fmt_name}.log"))
+            print(f"Preamble format dump failed ({reason or 'see ' + fmt_name + '.log'}), compiling certificates normally.")
+            return None
+        for ext in ['.tex', '.log']:
+            aux_file = os.path.join(tex_dir, f"{fmt_name}{ext}")
+            if os.path.exists(aux_file):
+                os.remove(aux_file)
+        print(f"Precompiled preamble format: {fmt_name}.fmt")
+        return os.path.abspath(os.path.join(tex_dir, fmt_name))
+
+    def _compile_combined_and_split(self, jobs, tex_dir: str, output_dir: str,
+                                    fmt_name: str = None, instrumentation: BuildInstrumentation = None):
+        """Typeset every job in one xelatex run and split the PDF into per-job files.
+
+        jobs is an iterable of (name, job_name, latex_content) tuples whose bodies
+        are streamed into one document; page i of the combined PDF becomes
+        output_dir/<job_name>.pdf for the i-th job. Returns a list of
+        (pdf_path, error) tuples in job order, or None if the single compile
+        could not be used and the caller should compile each job on its own.
+        """
+        try:
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            print("pypdf not found (pip install pypdf), compiling certificates one by one.")
+            return None
+        start_marker = r"\begin{document}"
+        end_marker = r"\end{document}"
+        batch_name = "certificates_batch"
+        job_names = []
+        combined_content = _CombinedWriter(os.path.join(tex_dir, f"{batch_name}.tex"))
+        try:
+            for _, job_name, latex_content in jobs:
+                start_pos = latex_content.find(start_marker)
+                end_pos = latex_content.find(end_marker)
+                if start_pos == -1 or end_pos == -1:
+                    print("Template has no document body, compiling certificates one by one.")
+                    return None
+                if not job_names:
+                    combined_content.append(latex_content[:start_pos + len(start_marker)])
+                combined_content.append(latex_content[start_pos + len(start_marker):end_pos].strip())
+                # Every certificate must start on a fresh page for the page-to-row mapping to hold
+                combined_content.append(r"\clearpage")
+                job_names.append(job_name)
+            combined_content.append(end_marker)
+        finally:
+            combined_content.close()
+        if not job_names:
+            return []
+
+        stats = {} if instrumentation is not None else None
+        # The whole batch shares one run; allow each certificate a couple of seconds on top
+        batch_pdf, error = self._run_xelatex(batch_name, tex_dir, tex_dir, fmt_name=fmt_name, stats=stats,
+                                             timeout=self.compile_timeout + 2 * len(job_names))
+        if stats:
+            for stage, seconds in stats.get("stages", {}).items():
+                instrumentation.record(None, stage, seconds)
+        if not batch_pdf:
+            print(f"Combined compile failed ({error or 'see ' + batch_name + '.tex'}), compiling certificates one by one.")
+            return None
+        split_started = time.perf_counter()
+        try:
+            reader = PdfReader(batch_pdf)
+            if len(reader.pages) != len(job_names):
+                # A certificate spilled onto a second page, so pages no longer map to rows
+                print(f"Combined PDF has {len(reader.pages)} pages for {len(job_names)} certificates, "
+                      "compiling certificates one by one.")
+                return None
+            results = []
+            for page, job_name in zip(reader.pages, job_names):
+                writer = PdfWriter()
+                writer.add_page(page)
+                pdf_destination = os.path.join(output_dir, f"{job_name}.pdf")
+                with open(pdf_destination + ".tmp", 'wb') as f:
+                    writer.write(f)
+                os.replace(pdf_destination + ".tmp", pdf_destination)
+                results.append((pdf_destination, None))
+            return results
+        finally:
+            os.remove(batch_pdf)
+            if instrumentation is not None:
+                instrumentation.record(None, "split", time.perf_counter() - split_started)
+
+    def merge_certificates(self, pdf_files: list, output_file: str):
+        """Concatenate already built certificate PDFs into one file, without recompiling.
+
+        Objects that are byte-identical across the certificates (such as the
+        background image) are stored only once. Returns output_file, or None if
+        pypdf is not installed.
+        """
+        try:
+            from pypdf import PdfWriter
+        except ImportError:
+            print("pypdf not found (pip install pypdf), cannot merge certificates.")
+            return None
+        writer = PdfWriter()
+        for pdf_file in pdf_files:
+            writer.append(pdf_file)
+        writer.compress_identical_objects()
+        # Write next to the target first so a failed merge never leaves a truncated PDF behind
+        with open(output_file + ".tmp", 'wb') as f:
+            writer.write(f)
+        os.replace(output_file + ".tmp", output_file)
+        return output_file
+
+    def _prepare_overlay(self, row_template: CompiledTemplate, tex_dir: str, fmt_name: str = None,
+                         fonts: dict = None, qr_url: str = None):
+        """Typeset the invariant parts of the certificate once for the overlay backend.
+
+        Every OVERLAY_FIELDS placeholder is replaced by a mark that makes xelatex
+        record where the text would start (\\pdfsavepos), together with the
+        font size and series there. With qr_url, {{CERTIFICATE_QR}} records
+        whether the template loads the qrcode package, so that the renderer
+        draws a QR code exactly when xelatex would. The base PDF and the
+        positions are cached in tex_dir under a hash of the base document.
+        Returns an _OverlayRenderer, or None (certificates are then compiled
+        with xelatex) if the base cannot be built or pypdf/reportlab are
+        missing.
+        """
+        try:
+            import pypdf  # noqa: F401
+            import reportlab  # noqa: F401
+        except ImportError:
+            print("The overlay backend needs pypdf and reportlab (pip install pypdf reportlab), using xelatex.")
+            return None
+        base_fields = {field: r"\certificateoverlaymark{%s}" % field for field in self.OVERLAY_FIELDS}
+        base_fields["CERTIFICATE_QR"] = r"\certificateoverlayqr" if qr_url else ""
+        base_latex = row_template.render(base_fields)
+        start_pos = base_latex.find(r"\begin{document}")
+        if start_pos == -1:
+            print("Template has no document body, using xelatex.")
+            return None
+        # The mark expands the font size and series now and the position at shipout, when it is final
+        mark_definition = r"""\makeatletter
+\newwrite\certificateoverlay@out
+\immediate\openout\certificateoverlay@out=\jobname.pos
+\newcommand{\certificateoverlaymark}[1]{\leavevmode\pdfsavepos\edef\certificateoverlay@entry{\noexpand\write\certificateoverlay@out{#1 \noexpand\the\noexpand\pdflastxpos\space\noexpand\the\noexpand\pdflastypos\space\f@size\space\f@series}}\certificateoverlay@entry}
+\newcommand{\certificateoverlayqr}{\ifdefined\qrcode\immediate\write\certificateoverlay@out{QR 0 0 0 m}\fi}
+\makeatother
+"""
+        base_latex = base_latex[:start_pos] + mark_definition + base_latex[start_pos:]
+        base_job = "certificate_overlay_base_" + hashlib.sha256(base_latex.encode('utf-8')).hexdigest()[:16]
+        base_pdf = os.path.join(tex_dir, f"{base_job}.pdf")
+        positions_file = os.path.join(tex_dir, f"{base_job}.pos")
+        if not (os.path.exists(base_pdf) and os.path.exists(positions_file)):
+            if fmt_name:
+                base_latex = self._mark_end_of_dump(base_latex)
+            pdf_path, error = self._compile_certificate(base_latex, base_job, tex_dir, tex_dir, fmt_name=fmt_name)
+            if not pdf_path or not os.path.exists(positions_file):
+                print(f"Overlay base page failed to compile ({error or 'see ' + base_job + '.tex'}), using xelatex.")
+                return None
+        positions = []
+        with open(positions_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 5:
+                    continue
+                field, x_sp, y_sp, size, series = parts
+                # Scaled points from the bottom left corner -> PDF points
+                to_points = 72 / 72.27 / 65536
+                positions.append((field, int(x_sp) * to_points, int(y_sp) * to_points, float(size),
+                                  series.startswith("b")))
+        draws_qr = any(field == "QR" for field, _, _, _, _ in positions)
+        positions = [position for position in positions if position[0] != "QR"]
+        print(f"Overlay base page: {base_pdf}")
+        return _OverlayRenderer(base_pdf, positions, fonts, qr_url=qr_url if draws_qr else None)
+
+    @staticmethod
+    def _render_overlay(overlay: _OverlayRenderer, fields: dict, job_name: str, output_dir: str,
+                        stats: dict = None) -> tuple:
+        """Stamp one certificate with the overlay backend; returns (pdf_path, error) like _compile_certificate."""
+        started = time.perf_counter()
+        try:
+            pdf_destination = overlay.render(fields, os.path.join(output_dir, f"{job_name}.pdf"))
+        except Exception as e:
+            return None, e
+        if stats is not None:
+            stats.setdefault("stages", {})["overlay"] = time.perf_counter() - started
+        return pdf_destination, None
+
+    def _link_assets(self, scratch_root: str):
+        """Make ASSET_FILES reachable from scratch_root the way the project directory provides them."""
+        for asset in self.ASSET_FILES:
+            if os.path.exists(asset):
+                link = os.path.join(scratch_root, asset)
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                try:
+                    os.symlink(os.path.abspath(asset), link)
+                except OSError:
+                    # Filesystems without symlinks get a copy
+                    shutil.copy2(asset, link)
+
+    def _compile_in_scratch(self, latex_content: str, job_name: str, index: int, work_dir: str,
+                            tex_dir: str, output_dir: str, fmt_name: str = None, stats: dict = None) -> tuple:
+        """Compile one certificate in a private scratch directory; see _compile_certificate.
+
+        The scratch job name carries the row index, so rows with the same name
+        never share files. The PDF is placed in output_dir atomically; the
+        sources of a failed compile are copied to tex_dir.
+        """
+        scratch_job = f"{job_name}-{index}"
+        pdf_path, error = self._compile_certificate(latex_content, scratch_job, work_dir, work_dir,
+                                                    fmt_name=fmt_name, stats=stats)
+        if pdf_path:
+            started = time.perf_counter()
+            pdf_destination = os.path.join(output_dir, f"{job_name}.pdf")
+            self._place_atomically(pdf_path, pdf_destination)
+            os.remove(os.path.join(work_dir, f"{scratch_job}.tex"))
+            if stats is not None:
+                stats["stages"]["move"] = stats["stages"].get("move", 0.0) + time.perf_counter() - started
+            return pdf_destination, error
+        os.makedirs(tex_dir, exist_ok=True)
+        for ext in ['.tex', '.log']:
+            scratch_file = os.path.join(work_dir, f"{scratch_job}{ext}")
+            if os.path.exists(scratch_file):
+                shutil.move(scratch_file, os.path.join(tex_dir, f"{job_name}{ext}"))
+        return None, error
+
+    @staticmethod
+    def _place_atomically(source: str, destination: str):
+        """Move source to destination so that readers never see a partially written file."""
+        try:
+            os.replace(source, destination)
+        except OSError:
+            # Different filesystems: copy next to the destination first, then rename over it
+            temporary = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source, temporary)
+            os.replace(temporary, destination)
+            os.remove(source)
+
+    def _compile_certificate(self, latex_content: str, job_name: str, tex_dir: str, output_dir: str,
+                             fmt_name: str = None, stats: dict = None) -> tuple:
+        """Write and compile one certificate, moving the PDF to output_dir.
+
+        If fmt_name is given, xelatex loads that precompiled preamble format
+        (a path as returned by _ensure_preamble_format). If a stats dict is
+        given, stats["stages"] receives the seconds spent writing the .tex,
+        running xelatex, moving the PDF and cleaning up, and stats["output"]
+        the end of the xelatex output if the compile failed.
+        Returns a (pdf_path, error) tuple; pdf_path is None if the compile failed.
+        """
+        started = time.perf_counter()
+        latex_filename = os.path.join(tex_dir, f"{job_name}.tex")
+        with open(latex_filename, 'w', encoding='utf-8') as f:
+            f.write(latex_content)
+        if stats is not None:
+            stats.setdefault("stages", {})["write_tex"] = time.perf_counter() - started
+        return self._run_xelatex(job_name, tex_dir, output_dir, fmt_name=fmt_name, stats=stats)
+
+    def _run_xelatex(self, job_name: str, tex_dir: str, output_dir: str, fmt_name: str = None,
+                     stats: dict = None, timeout: float = None) -> tuple:
+        """Compile tex_dir/<job_name>.tex and move the PDF to output_dir; see _compile_certificate.
+
+        The run is supervised by _run_supervised (timeout defaults to
+        compile_timeout); a run killed by a signal from outside (e.g. the
+        kernel's out-of-memory killer) is retried compile_retries times, one
+        that timed out is not. If the compile fails, the error is a CompileError carrying the
+        first error of the .log.
+        """
+        stages = stats.setdefault("stages", {}) if stats is not None else {}
+        pdf_filename = f"{job_name}.pdf"
+        command = [self.xelatex] + self.XELATEX_OPTIONS
+        env = None
+        if fmt_name:
+            command.append(f"-fmt={os.path.basename(fmt_name)}")
+            # Let kpathsea find the format wherever it was dumped; the trailing separator keeps the default path
+            env = dict(os.environ, TEXFORMATS=os.path.dirname(fmt_name) + os.pathsep)
+        try:
+            started = time.perf_counter()
+            for attempt in range(self.compile_retries + 1):
+                returncode, output, killed = self._run_supervised(command + [f"{job_name}.tex"], tex_dir,
+                                                                  env=env, timeout=timeout)
+                # TeX is deterministic: a run that timed out would only time out again
+                if killed is None or killed.startswith("timed out"):
+                    break
+            stages["xelatex"] = time.perf_counter() - started
+            if returncode == 0 and os.path.exists(os.path.join(tex_dir, pdf_filename)):
+                started = time.perf_counter()
+                pdf_source = os.path.join(tex_dir, pdf_filename)
+                pdf_destination = os.path.join(output_dir, pdf_filename)
+                self._place_atomically(pdf_source, pdf_destination)
+                stages["move"] = time.perf_counter() - started
+                started = time.perf_counter()
+                for ext in ['.aux', '.log', '.out']:
+                    aux_file = os.path.join(tex_dir, f"{job_name}{ext}")
+                    if os.path.exists(aux_file):
+                        os.remove(aux_file)
+                stages["cleanup"] = time.perf_counter() - started
+                return pdf_destination, None
+            if stats is not None:
+                # Keep the end of the output; the full log stays in tex_dir/<job_name>.log
+                stats["output"] = output[-2000:]
+            message = self._first_log_error(os.path.join(tex_dir, f"{job_name}.log"))
+            if killed:
+                message = f"{killed} ({attempt + 1} attempt(s))" + (f"; {message}" if message else "")
+            return None, CompileError(message or f"xelatex exited with code {returncode}")
+        except Exception as e:
+            return None, e
+
+    def _run_supervised(self, command: list, cwd: str, env: dict = None, timeout: float = None) -> tuple:
+        """Run a TeX command under the watchdog; returns (returncode, output, killed).
+
+        The process gets no terminal input, runs in its own process group and
+        is killed with everything it started once timeout (default
+        compile_timeout) seconds have passed. With memory_limit its address
+        space is capped (Linux; set with prlimit after the start, as
+        preexec_fn is not safe in the compile threads). killed is None, or the
+        reason the run was stopped ("timed out", "killed by signal N").
+        Raises FileNotFoundError if the engine is not installed.
+        """
+        timeout = self.compile_timeout if timeout is None else timeout
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True, errors='replace',
+                                   start_new_session=hasattr(os, "killpg"))
+        if self.memory_limit:
+            limit = self.memory_limit * 1024 * 1024
+            try:
+                import resource
+                resource.prlimit(process.pid, resource.RLIMIT_AS, (limit, limit))
+            except (ImportError, AttributeError, OSError, ValueError):
+                # No prlimit on this platform (or the process already exited)
+                pass
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if hasattr(os, "killpg"):
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                process.kill()
+            output, _ = process.communicate()
+            return process.returncode, output, f"timed out after {timeout:g} s"
+        if process.returncode < 0:
+            # Killed from outside, e.g. by the kernel for exceeding the memory limit
+            return process.returncode, output, f"killed by signal {-process.returncode}"
+        return process.returncode, output, None
+
+    @classmethod
+    def _first_log_error(cls, log_file: str):
+        """Return the first error of a TeX log, with the input line it occurred on, or None."""
+        try:
+            with open(log_file, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        for i, line in enumerate(lines):
+            match = cls.LOG_ERROR_PATTERN.match(line)
+            if match:
+                message = match.group("message").strip()
+                # TeX shows the offending input on an "l.<number> ..." line shortly after
+                for context in lines[i + 1:i + 12]:
+                    if context.startswith("l."):
+                        return f"{message} ({context.strip()})"
+                return message
+        return None
+
+
+class TemplateCache:
+    def __init__(self, maxsize: int = 8, xelatex: str = "xelatex", **generator_options):
+        """Keep up to maxsize CertificateGenerators, one per template file, least recently used first out.
+
+        A cached generator keeps its parsed template, so events sharing a
+        template parse it once. Preamble formats are named after the preamble's
+        hash and shared by all generators of the cache, so templates with the
+        same preamble dump it once. Entries are keyed by path and modification
+        time; an edited template is loaded again. generator_options (e.g.
+        compile_timeout) are passed on to every CertificateGenerator.
+        """
+        self.maxsize = max(1, maxsize)
+        self.xelatex = xelatex
+        self.generator_options = generator_options
+        self._generators = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._preamble_formats = {}
+        self._format_lock = threading.Lock()
+
+    def get(self, template_file: str) -> CertificateGenerator:
+        key = (os.path.abspath(template_file), os.stat(template_file).st_mtime_ns)
+        with self._lock:
+            generator = self._generators.get(key)
+            if generator is not None:
+                self._generators.move_to_end(key)
+                return generator
+        generator = CertificateGenerator(template_file, xelatex=self.xelatex, **self.generator_options)
+        generator._preamble_formats = self._preamble_formats
+        generator._format_lock = self._format_lock
+        with self._lock:
+            generator = self._generators.setdefault(key, generator)
+            self._generators.move_to_end(key)
+            while len(self._generators) > self.maxsize:
+                self._generators.popitem(last=False)
+        return generator
+
+
+def _load_manifest(manifest_file: str) -> dict:
+    """Read an event manifest from JSON, or from YAML (.yaml/.yml, needs PyYAML)."""
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        if manifest_file.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML manifests need PyYAML (pip install pyyaml); use a .json manifest instead")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def generate_from_manifest(manifest_file: str, workers: int = None, cache_size: int = 8, concurrent_events: int = 4,
+                           xelatex: str = "xelatex", merge_individual_pdfs: bool = True,
+                           generator_options: dict = None, **defaults) -> dict:
+    """Build the certificates of every event listed in a manifest in one process.
+
+    The manifest holds a list of events and optional shared settings:
+
+        {"defaults": {"precompile_preamble": true, "tutors": "..."},
+         "events": [{"name": "neuro-ai", "roster": "neuro_ai.csv", "template": "certificate_template.tex",
+                     "workshop_title": "...", "contents": ["..."], ...}, ...]}
+
+    Every other key of an event (or of "defaults") is passed on to
+    generate_individual_certificates_from_csv, on top of the keyword
+    arguments given here. PDFs go to output/events/<name>/ unless the event
+    sets output_dir; the TeX files to output/tex-<name>/, two levels below the
+    template's assets. Templates come from a TemplateCache of cache_size
+    entries, built with generator_options (compile_timeout, memory_limit,
+    compile_retries). Up to concurrent_events events are rendered at once,
+    and all of their rows are compiled on one shared pool of `workers`
+    threads; an event that sets workers keeps at most that many of its rows
+    queued on it.
+    Returns {event name: list of generated PDFs}.
+    """
+    manifest = _load_manifest(manifest_file)
+    defaults = dict(defaults, **manifest.get("defaults", {}))
+    events = manifest.get("events", [])
+    if workers is None:
+        workers = os.cpu_count() or 1
+    templates = TemplateCache(cache_size, xelatex=xelatex, **(generator_options or {}))
+    results = {}
+
+    def build_event(event, executor):
+        options = dict(defaults, **event)
+        name = options.pop("name")
+        roster = options.pop("roster")
+        generator = templates.get(options.pop("template", "certificate_template.tex"))
+        safe_name = CertificateGenerator._safe_name(name)
+        options.setdefault("output_dir", os.path.join("output", "events", safe_name))
+        options.setdefault("tex_dir", os.path.join("output", f"tex-{safe_name}"))
+        print(f"Event {name}: generating certificates from {roster}...")
+        # The shared pool has `workers` threads; an event's own workers only limits its rows in flight
+        event_workers = min(options.pop("workers", None) or workers, workers)
+        pdfs = generator.generate_individual_certificates_from_csv(roster, workers=event_workers, executor=executor,
+                                                                   **options)
+        print(f"Event {name}: generated {len(pdfs)} certificates in {options['output_dir']}")
+        if merge_individual_pdfs and pdfs:
+            generator.merge_certificates(pdfs, os.path.join(options["output_dir"], "all_certificates.pdf"))
+        return name, pdfs
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as compile_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrent_events)) as event_pool:
+        futures = [event_pool.submit(build_event, event, compile_pool) for event in events]
+        for event, future in zip(events, futures):
+            try:
+                name, pdfs = future.result()
+                results[name] = pdfs
+            except Exception as e:
+                print(f"Event {event.get('name')} failed: {e}")
+    return results
+
 
 def main():
     """Generate certificates from CSV file."""
-    generator = CertificateGenerator()
     # Common certificate fields (using the same content as debug mode)
     workshop_title = "Neuro-AI: Artificial Intelligence Applications in Neuroscience"
     tutors = "Dr. Mario Archila"
@@ -264,13 +2025,97 @@ def main():
     signatory1 = "Dr. Mario Archila"
     signatory2 = "Prof. Dr. Gyula Kovács"
     location = "Jena"
-    
+    # Number of parallel xelatex compiles (None uses every CPU core)
+    workers = None
+    # Dump the template preamble once into a cached format (needs the mylatexformat package)
+    precompile_preamble = False
+    # Typeset all certificates in one xelatex run and split the PDF per person (needs pypdf)
+    single_compile = False
+    # Skip certificates whose PDF is unchanged since the last run (see output/pdfs/.build_manifest.json)
+    incremental = True
+    # Build all_certificates.pdf by merging the individual PDFs instead of a second compile (needs pypdf)
+    merge_individual_pdfs = True
+    # Compile in per-worker directories here (e.g. "/dev/shm/certificates" on a tmpfs) instead of output/tex
+    scratch_dir = None
+    # "overlay" typesets the page once and stamps names and dates onto it (needs pypdf and reportlab)
+    backend = "xelatex"
+    # Check the whole roster (names, font coverage, duplicate file names, dates) before compiling
+    validate = True
+    # JSON-lines log of per-row and per-stage timings (None turns instrumentation off)
+    event_log = "output/build_events.jsonl"
+    # Sign every PDF (needs pyhanko), e.g. {"key_file": "signing/key.pem", "cert_file": "signing/cert.pem"}
+    # or {"pkcs12_file": "signing/signer.p12", "passphrase": "..."}
+    signing = None
+    # Move the PDFs into an archive instead of keeping them in output/pdfs, e.g. "output/certificates.zip"
+    # (or .tar/.tar.gz), starting a new archive every archive_size certificates if set
+    archive = None
+    archive_size = None
+    # Email every certificate to the address in the roster's "email" column (see certificate_mail.py), e.g.
+    # {"host": "smtp.example.org", "port": 587, "starttls": True, "username": "...", "password": "...",
+    #  "sender": "Department of Great Ideas <certificates@example.org>", "rate": 5}
+    email_delivery = None
+    # Record every certificate (ID, name, course) for verification with certificate_lookup.py (None turns it off)
+    certificate_index_file = "output/certificate_index.sqlite"
+    # URL for a QR code on every certificate, with {id} for the certificate ID (needs the LaTeX qrcode package)
+    qr_url = None
+    # Kill an xelatex run after this many seconds (a normal compile takes a few) and cap its memory (MB, Linux);
+    # runs killed from outside, e.g. out of memory, are retried compile_retries times
+    compile_timeout = 30.0
+    compile_retries = 1
+    memory_limit = None
+
+    generator = CertificateGenerator(compile_timeout=compile_timeout, memory_limit=memory_limit,
+                                     compile_retries=compile_retries)
+    parser = argparse.ArgumentParser(description="Generate certificates from names.csv")
+    parser.add_argument("--manifest", help="YAML or JSON file listing several events to build in one run")
+    args = parser.parse_args()
+    signer = None
+    if signing:
+        try:
+            signer = CertificateSigner(**signing)
+        except ImportError:
+            print("Signing needs pyHanko (pip install pyhanko), certificates are not signed.")
+    certificate_index = CertificateIndex(certificate_index_file) if certificate_index_file else None
+    if args.manifest:
+        # The settings above are defaults; the manifest overrides them per event
+        results = generate_from_manifest(
+            args.manifest,
+            workers=workers,
+            xelatex=generator.xelatex,
+            merge_individual_pdfs=merge_individual_pdfs,
+            generator_options={"compile_timeout": compile_timeout, "memory_limit": memory_limit,
+                               "compile_retries": compile_retries},
+            precompile_preamble=precompile_preamble,
+            incremental=incremental,
+            scratch_dir=scratch_dir,
+            backend=backend,
+            validate=validate,
+            signer=signer,
+            certificate_index=certificate_index,
+            qr_url=qr_url
+        )
+        if certificate_index is not None:
+            certificate_index.close()
+        print(f"Generated {sum(len(pdfs) for pdfs in results.values())} certificates for {len(results)} events")
+        return
+
     # Check if names.csv exists and generate certificates from it
     csv_file = "names.csv"
     if os.path.exists(csv_file):
         print("Generating certificates from names.csv...")
         # Generate individual certificates for each person
         print("Generating individual certificates...")
+        mailer = None
+        on_result = None
+        if email_delivery:
+            from certificate_mail import CertificateMailer, email_on_result
+            mailer = CertificateMailer(**email_delivery)
+            on_result = email_on_result(mailer, csv_file)
+        instrumentation = None
+        if event_log:
+            with open(csv_file, 'r', encoding='utf-8') as f:
+                total_rows = max(0, sum(1 for line in f if line.strip()) - 1)
+            instrumentation = BuildInstrumentation(event_log=event_log, total_rows=total_rows)
         individual_pdfs = generator.generate_individual_certificates_from_csv(
             csv_file,
             output_dir="output/pdfs",
@@ -282,63 +2127,92 @@ def main():
             date_range=date_range,
             signatory1=signatory1,
             signatory2=signatory2,
-            location=location
+            location=location,
+            workers=workers,
+            precompile_preamble=precompile_preamble,
+            single_compile=single_compile,
+            incremental=incremental,
+            instrumentation=instrumentation,
+            scratch_dir=scratch_dir,
+            backend=backend,
+            validate=validate,
+            signer=signer,
+            archive=archive,
+            archive_size=archive_size,
+            on_result=on_result,
+            certificate_index=certificate_index,
+            qr_url=qr_url
         )
+        if mailer is not None:
+            mailer.close()
+        if certificate_index is not None:
+            certificate_index.close()
+        if archive:
+            # The archives replace the pdfs/ folder and the combined PDF
+            return
         print(f"Generated {len(individual_pdfs)} individual certificates in pdfs/ folder")
-        # Also generate a combined PDF with all certificates
-        print("Generating combined certificate file...")
-        output_file = generator.generate_certificates_from_csv(
-            csv_file,
-            output_file="output/tex/certificates.tex",
-            workshop_title=workshop_title,
-            tutors=tutors,
-            duration=duration,
-            contents=contents,
-            date=date,
-            date_range=date_range,
-            signatory1=signatory1,
-            signatory2=signatory2,
-            location=location
-        )
-        print(f"Generated LaTeX file: {output_file}")
-        # Compile to PDF
-        print("Compiling combined PDF...")
-        try:
-            import subprocess
-            # Change to the tex directory for compilation
-            tex_dir = "output/tex"
-            os.makedirs(tex_dir, exist_ok=True)
-            result = subprocess.run(
-                ["xelatex", "-interaction=nonstopmode", "certificates.tex"],
-                capture_output=True,
-                text=True,
-                cwd=tex_dir
+        combined_pdf = None
+        if merge_individual_pdfs:
+            print("Merging individual certificates into combined PDF...")
+            combined_pdf = generator.merge_certificates(
+                individual_pdfs, os.path.join("output/pdfs", "all_certificates.pdf")
             )
-            if result.returncode == 0:
-                print("PDF compilation successful!")
-                # Move PDF to pdfs folder
-                pdf_source = os.path.join(tex_dir, "certificates.pdf")
-                if os.path.exists(pdf_source):
-                    import shutil
-                    pdf_destination = os.path.join("output/pdfs", "all_certificates.pdf")
-                    shutil.move(pdf_source, pdf_destination)
-                    print(f"Combined PDF saved to: {pdf_destination}")
-                    # Clean up auxiliary files
-                    for ext in ['.aux', '.log', '.out']:
-                        aux_file = os.path.join(tex_dir, f"certificates{ext}")
-                        if os.path.exists(aux_file):
-                            os.remove(aux_file)
-                    print("Auxiliary files cleaned up.")
+            if combined_pdf:
+                print(f"Combined PDF saved to: {combined_pdf}")
+        if combined_pdf is None:
+            # Also generate a combined PDF with all certificates
+            print("Generating combined certificate file...")
+            output_file = generator.generate_certificates_from_csv(
+                csv_file,
+                output_file="output/tex/certificates.tex",
+                workshop_title=workshop_title,
+                tutors=tutors,
+                duration=duration,
+                contents=contents,
+                date=date,
+                date_range=date_range,
+                signatory1=signatory1,
+                signatory2=signatory2,
+                location=location
+            )
+            print(f"Generated LaTeX file: {output_file}")
+            # Compile to PDF
+            print("Compiling combined PDF...")
+            try:
+                # Change to the tex directory for compilation
+                tex_dir = "output/tex"
+                os.makedirs(tex_dir, exist_ok=True)
+                # One run for every certificate; allow each a couple of seconds on top of the usual timeout
+                returncode, output, killed = generator._run_supervised(
+                    [generator.xelatex] + generator.XELATEX_OPTIONS + ["certificates.tex"],
+                    tex_dir,
+                    timeout=generator.compile_timeout + 2 * len(individual_pdfs)
+                )
+                if returncode == 0:
+                    print("PDF compilation successful!")
+                    # Move PDF to pdfs folder
+                    pdf_source = os.path.join(tex_dir, "certificates.pdf")
+                    if os.path.exists(pdf_source):
+                        import shutil
+                        pdf_destination = os.path.join("output/pdfs", "all_certificates.pdf")
+                        shutil.move(pdf_source, pdf_destination)
+                        print(f"Combined PDF saved to: {pdf_destination}")
+                        # Clean up auxiliary files
+                        for ext in ['.aux', '.log', '.out']:
+                            aux_file = os.path.join(tex_dir, f"certificates{ext}")
+                            if os.path.exists(aux_file):
+                                os.remove(aux_file)
+                        print("Auxiliary files cleaned up.")
+                    else:
+                        print("PDF file not found after compilation.")
                 else:
-                    print("PDF file not found after compilation.")
-            else:
-                print("PDF compilation failed!")
-                print("Error output:")
-                print(result.stderr)
-        except FileNotFoundError:
-            print("XeLaTeX not found. Please install a LaTeX distribution (like TeX Live or MiKTeX).")
-        except Exception as e:
-            print(f"Error during compilation: {e}")
+                    print("PDF compilation failed!")
+                    error = killed or generator._first_log_error(os.path.join(tex_dir, "certificates.log"))
+                    print(f"Error: {error}" if error else f"Error output:\n{output[-2000:]}")
+            except FileNotFoundError:
+                print("XeLaTeX not found. Please install a LaTeX distribution (like TeX Live or MiKTeX).")
+            except Exception as e:
+                print(f"Error during compilation: {e}")
     else:
         print(f"CSV file '{csv_file}' not found. Please create it with 'Lastname', 'Name', and 'completion_date' columns.")
         # Fallback to example list
@@ -0,0 +1,117 @@
+"""Email delivery against a local SMTP stand-in."""
+
+import json
+import socketserver
+import threading
+
+import pytest
+
+from certificate_mail import CertificateMailer, email_on_result
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: RCPT replies are looked up in server.replies."""
+
+    def handle(self):
+        server = self.server
+        self.reply("220 stand-in ready")
+        recipient = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "RCPT":
+                recipient = command.split("<", 1)[1].split(">", 1)[0]
+                with server.lock:
+                    server.attempts.append(recipient)
+                    replies = server.replies.get(recipient, [])
+                    self.reply(replies.pop(0) if replies else "250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.delivered.append(recipient)
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+    def reply(self, text: str):
+        self.wfile.write((text + "\r\n").encode("ascii"))
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+@pytest.fixture
+def smtp_server():
+    server = _SMTPServer(("127.0.0.1", 0), _SMTPHandler)
+    server.lock = threading.Lock()
+    server.replies = {}
+    server.attempts = []
+    server.delivered = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_mailer(server, ledger) -> CertificateMailer:
+    return CertificateMailer(host="127.0.0.1", port=server.server_address[1], connections=2,
+                             max_attempts=3, retry_delay=0.01, ledger=str(ledger))
+
+
+def ledger_entries(ledger) -> dict:
+    with open(ledger, encoding="utf-8") as f:
+        return {entry["email"]: entry for entry in map(json.loads, f)}
+
+
+def test_temporary_failure_is_retried_and_permanent_failure_is_not(tmp_path, smtp_server):
+    pdf = tmp_path / "certificate_ada.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n%%EOF\n")
+    smtp_server.replies["flaky@example.org"] = ["451 try again later"]
+    smtp_server.replies["gone@example.org"] = ["550 no such user"]
+    ledger = tmp_path / "ledger.jsonl"
+
+    mailer = make_mailer(smtp_server, ledger)
+    for index, address in enumerate(["ok@example.org", "flaky@example.org", "gone@example.org"]):
+        mailer.send(index, "Ada", address, str(pdf))
+    counts = mailer.close()
+
+    assert counts == {"sent": 2, "failed": 1}
+    assert sorted(smtp_server.delivered) == ["flaky@example.org", "ok@example.org"]
+    assert smtp_server.attempts.count("flaky@example.org") == 2
+    assert smtp_server.attempts.count("gone@example.org") == 1
+    entries = ledger_entries(ledger)
+    assert entries["flaky@example.org"]["status"] == "sent"
+    assert entries["gone@example.org"]["status"] == "failed"
+    assert entries["gone@example.org"]["error"].startswith("550")
+
+
+def test_rerun_does_not_send_twice(tmp_path, smtp_server):
+    roster = tmp_path / "names.csv"
+    roster.write_text("name, email\nAda, ada@example.org\nAlan, alan@example.org\nGrace, grace@example.org\n")
+    pdfs = []
+    for name in ("ada", "alan", "grace"):
+        pdfs.append(tmp_path / f"certificate_{name}.pdf")
+        pdfs[-1].write_bytes(b"%PDF-1.4\n%%EOF\n")
+    ledger = tmp_path / "ledger.jsonl"
+
+    def run(indexes) -> dict:
+        mailer = make_mailer(smtp_server, ledger)
+        on_result = email_on_result(mailer, str(roster))
+        for index in indexes:
+            on_result(index, "Someone", str(pdfs[index]), None)
+        return mailer.close()
+
+    assert run([0, 2]) == {"sent": 2}
+    assert run([0, 1, 2]) == {"sent": 1, "already_sent": 2}
+    assert sorted(smtp_server.delivered) == ["ada@example.org", "alan@example.org", "grace@example.org"]
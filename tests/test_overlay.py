@@ -0,0 +1,116 @@
+"""The overlay backend against the xelatex backend."""
+
+import shutil
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+pytest.importorskip("reportlab")
+
+from generate_certificates import CertificateGenerator, _OverlayRenderer  # noqa: E402
+
+# TeX Gyre Heros has Helvetica's metrics, like the overlay's default font
+TEMPLATE = r"""\documentclass{article}
+\usepackage{fontspec}
+\setmainfont{TeX Gyre Heros}
+\pagestyle{empty}
+\begin{document}
+\vspace*{5cm}
+{\fontsize{24}{28}\selectfont\bfseries {{NAME}}\par}
+\vspace{1cm}
+{\fontsize{12}{14}\selectfont {{DATE}}\par}
+\end{document}
+"""
+
+
+def text_origins(pdf_path: str) -> list:
+    """(text, x, y) of every text fragment on the first page, in PDF points."""
+    origins = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        if text.strip():
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            origins.append((text.strip(), x, y))
+
+    pypdf.PdfReader(pdf_path).pages[0].extract_text(visitor_text=visitor)
+    return origins
+
+
+def origin_of(origins: list, prefix: str) -> tuple:
+    return next((x, y) for text, x, y in origins if text.startswith(prefix))
+
+
+def blank_renderer(tmp_path, fonts=None) -> _OverlayRenderer:
+    base_pdf = str(tmp_path / "base.pdf")
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(595, 842)
+    with open(base_pdf, 'wb') as f:
+        writer.write(f)
+    return _OverlayRenderer(base_pdf, [("NAME", 100, 400, 24, True), ("DATE", 100, 300, 12, False)], fonts)
+
+
+def test_default_fonts_cover_latin1_only(tmp_path):
+    renderer = blank_renderer(tmp_path)
+    assert renderer.covers({"NAME": "Zoë Müller-Ødegård", "DATE": "2025-03-01"})
+    assert not renderer.covers({"NAME": "Łukasiewicz", "DATE": "2025-03-01"})
+    assert not renderer.covers({"NAME": "山田 太郎", "DATE": "2025-03-01"})
+
+
+def test_overlay_draws_fields_at_their_positions(tmp_path):
+    renderer = blank_renderer(tmp_path)
+    pdf = renderer.render({"NAME": "Abraham Lincoln", "DATE": "2025-03-01"}, str(tmp_path / "out.pdf"))
+    origins = text_origins(pdf)
+    assert origin_of(origins, "Abraham") == pytest.approx((100, 400))
+    assert origin_of(origins, "2025") == pytest.approx((100, 300))
+
+
+def rectangle_corners(pdf_path: str) -> list:
+    """Lower left corner of every rectangle on the first page, in PDF points."""
+    corners = []
+
+    def visitor(operator, operands, cm, tm):
+        if operator == b"re":
+            x, y = float(operands[0]), float(operands[1])
+            corners.append((x * cm[0] + y * cm[2] + cm[4], x * cm[1] + y * cm[3] + cm[5]))
+
+    pypdf.PdfReader(pdf_path).pages[0].extract_text(visitor_operand_before=visitor)
+    return corners
+
+
+def test_overlay_draws_qr_code_in_the_bottom_right_corner(tmp_path):
+    fields = {"NAME": "Abraham Lincoln", "DATE": "2025-03-01", "CERTIFICATE_ID": "K7QX-M2PA-9TDE"}
+    plain = blank_renderer(tmp_path).render(fields, str(tmp_path / "plain.pdf"))
+    renderer = blank_renderer(tmp_path)
+    renderer.qr_url = "https://example.org/verify/{id}"
+    with_qr = renderer.render(fields, str(tmp_path / "qr.pdf"))
+    modules = [corner for corner in rectangle_corners(with_qr) if corner not in rectangle_corners(plain)]
+    # Runs of dark modules are drawn as one rectangle each; a QR code still needs well over a hundred
+    assert len(modules) > 100
+    left, bottom = renderer.page_size[0] - renderer.QR_MARGINS[0], renderer.QR_MARGINS[1]
+    assert min(x for x, _ in modules) == pytest.approx(left, abs=0.5)
+    assert min(y for _, y in modules) == pytest.approx(bottom, abs=0.5)
+    assert max(x for x, _ in modules) < left + renderer.QR_SIZE
+    assert max(y for _, y in modules) < bottom + renderer.QR_SIZE
+
+
+@pytest.mark.skipif(shutil.which("xelatex") is None, reason="needs XeLaTeX")
+@pytest.mark.parametrize("name", ["Abraham Lincoln", "Jan Łukasiewicz"])
+def test_overlay_matches_xelatex(tmp_path, monkeypatch, name):
+    """Render the same row with both backends; the name and date start at the same place."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "template.tex").write_text(TEMPLATE, encoding="utf-8")
+    generator = CertificateGenerator("template.tex")
+    participants = [(name, "2025-03-01")]
+    options = dict(tex_dir="output/tex", incremental=False, validate=False, workers=1)
+    xelatex_pdfs = generator.generate_individual_certificates(participants, output_dir="output/xelatex",
+                                                              backend="xelatex", **options)
+    overlay_pdfs = generator.generate_individual_certificates(participants, output_dir="output/overlay",
+                                                              backend="overlay", **options)
+    assert len(xelatex_pdfs) == len(overlay_pdfs) == 1
+    xelatex_origins = text_origins(xelatex_pdfs[0])
+    overlay_origins = text_origins(overlay_pdfs[0])
+    first_word = name.split()[0]
+    # Positions come from \pdfsavepos in scaled points; allow for rounding
+    assert origin_of(overlay_origins, first_word) == pytest.approx(origin_of(xelatex_origins, first_word), abs=0.5)
+    assert origin_of(overlay_origins, "2025") == pytest.approx(origin_of(xelatex_origins, "2025"), abs=0.5)
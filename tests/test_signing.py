@@ -0,0 +1,85 @@
+"""Signing certificates with a locally generated self-signed key."""
+
+import datetime
+
+import pytest
+
+pytest.importorskip("pyhanko")
+pypdf = pytest.importorskip("pypdf")
+
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+
+from generate_certificates import CertificateSigner  # noqa: E402
+
+
+def self_signed_key(directory) -> tuple:
+    """Write a self-signed RSA key and certificate as PEM files; returns their paths."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Certificate Test Signer")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.KeyUsage(digital_signature=True, content_commitment=True, key_encipherment=False,
+                                     data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                                     crl_sign=False, encipher_only=False, decipher_only=False), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    key_file = directory / "key.pem"
+    cert_file = directory / "cert.pem"
+    key_file.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    cert_file.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    return str(key_file), str(cert_file)
+
+
+def blank_pdf(path) -> str:
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(595, 842)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_signature_is_valid_and_covers_the_file(tmp_path):
+    from pyhanko.keys import load_cert_from_pemder
+    from pyhanko.pdf_utils.reader import PdfFileReader
+    from pyhanko.sign.validation import validate_pdf_signature
+    from pyhanko.sign.validation.status import SignatureCoverageLevel
+    from pyhanko_certvalidator import ValidationContext
+
+    key_file, cert_file = self_signed_key(tmp_path)
+    signer = CertificateSigner(key_file=key_file, cert_file=cert_file, reason="Certificate of attendance")
+    pdf_path = blank_pdf(tmp_path / "certificate.pdf")
+    with open(pdf_path, 'rb') as f:
+        unsigned = f.read()
+
+    signer.sign(pdf_path)
+
+    with open(pdf_path, 'rb') as f:
+        signed = f.read()
+        # The signature is an incremental update; the compiled PDF stays byte for byte the same
+        assert signed.startswith(unsigned)
+        f.seek(0)
+        reader = PdfFileReader(f)
+        assert len(reader.embedded_signatures) == 1
+        context = ValidationContext(trust_roots=[load_cert_from_pemder(cert_file)])
+        status = validate_pdf_signature(reader.embedded_signatures[0], context)
+    assert status.intact and status.valid and status.trusted
+    assert status.coverage == SignatureCoverageLevel.ENTIRE_FILE
+
+
+def test_unreadable_key_is_reported(tmp_path):
+    _, cert_file = self_signed_key(tmp_path)
+    (tmp_path / "bad.pem").write_text("not a key")
+    with pytest.raises(ValueError, match="Could not load the signing key"):
+        CertificateSigner(key_file=str(tmp_path / "bad.pem"), cert_file=cert_file)